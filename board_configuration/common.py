@@ -61,3 +61,19 @@ board_eeprom_i2c = [
         "at24cxx": {"addr": 0x50, "type": 1},
     },
 ]
+
+"""maps the BOARD_ID name stored in EEPROM to the board configuration name, board revision is appended if needed"""
+board_eeprom_names = {
+    "NXP i.MX8DXL EVK Board": "imx8dxlevk",
+    "NXP i.MX8DXL EVK DDR3 Board": "imx8dxlevkddr3",
+    "NXP i.MX8MP EVK Board": "imx8mpevk",
+    "NXP i.MX8MP EVK PWR Board": "imx8mpevkpwr",
+    "NXP i.MX8MP DDR3L Board": "imx8mpddr3l",
+    "NXP i.MX8MP DDR4 Board": "imx8mpddr4",
+    "NXP i.MX8ULP EVK Board": "imx8ulpevk",
+    "NXP i.MX8ULP EVK9 Board": "imx8ulpevk9",
+    "NXP VAL_BOARD_1 Board": "val_board_1",
+    "NXP VAL_BOARD_2 Board": "val_board_2",
+    "NXP i.MX93 EVK Board": "imx93evk11",
+    "NXP i.MX95 EVK Board": "imx95evk19",
+}
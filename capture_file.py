@@ -0,0 +1,686 @@
+# Copyright 2020-2022 NXP
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# Neither the name of the NXP Semiconductors nor the names of its
+# contributors may be used to endorse or promote products derived from this
+# software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""versioned chunked .pmt capture files holding the raw PAC codes of the rails, and the reader of the pickled ones"""
+
+import json
+import mmap
+import os
+import pickle
+import struct
+import zlib
+
+import numpy as np
+
+import data_buffer
+import program_config
+
+# file layout: MAGIC, header length (uint32) and JSON header, the chunks, then the JSON index of the chunks
+# and the trailer giving its offset. A file without trailer (capture interrupted) is read by scanning the chunks.
+MAGIC = b"PMT2"
+VERSION = 2
+HEADER = struct.Struct("<I")
+# chunk: magic, stream, compressor, rows, meta length, payload length, then the JSON meta and the payload
+CHUNK = struct.Struct("<4sHBIII")
+CHUNK_MAGIC = b"CHNK"
+INDEX_MAGIC = b"INDX"
+TRAILER = struct.Struct("<Q4s")  # index offset, magic
+TRAILER_MAGIC = b"PEND"
+
+# The summary streams of the rails and groups keep per block of SUMMARY_BLOCK samples the time of its first sample,
+# the min, max, sum and sum of squares of each key and the integral of the power since the sample before it.
+# A block is a row of the level 3 of the plot pyramids, the finer levels are decimated from the samples on demand.
+SUMMARY_BLOCK = 4096
+SUMMARY_LEVEL = 3
+SUMMARY_STATS = ("min", "max", "sum", "sum_sq")
+SUMMARY_KEYS = {"rail": ("voltage", "current", "power"), "group": ("power",)}
+# number of samples of a stream summarized, or written by write_histories, at once
+SUMMARY_PIECE = 64 * SUMMARY_BLOCK
+
+# columns of the chunk payloads per stream kind, stored one after the other
+COLUMNS = {
+    "rail": (("time", "<f8"), ("vbus", "<u2"), ("vsense", "<u2")),
+    "group": (("time", "<f8"), ("power", "<f8")),
+    "temperature": (("time", "<f8"), ("value", "<f8")),
+}
+for _kind, _keys in SUMMARY_KEYS.items():
+    COLUMNS[_kind + "_summary"] = (
+        (("time", "<f8"),)
+        + tuple((key + "_" + stat, "<f8") for key in _keys for stat in SUMMARY_STATS)
+        + (("area", "<f8"),)
+    )
+COMPRESSORS = {None: 0, "zlib": 1}
+CACHED_CHUNKS = 16  # decompressed chunks kept by a reader
+
+
+class CaptureWriter:
+    """writes a capture incrementally, the samples appended to a stream are stored by chunks of chunk_rows"""
+
+    def __init__(
+        self,
+        path,
+        board,
+        streams,
+        groups=(),
+        compressor=program_config.CAPTURE_COMPRESSOR,
+        chunk_rows=program_config.CAPTURE_CHUNK_ROWS,
+    ):
+        if compressor not in COMPRESSORS:
+            raise ValueError("Unknown capture compressor " + str(compressor))
+        self.compressor = compressor
+        self.chunk_rows = chunk_rows
+        self.streams = [dict(stream) for stream in streams]
+        self.pending = [[] for _ in self.streams]
+        self.rows = [0] * len(self.streams)  # rows of each stream already in chunks
+        self.segments = [[] for _ in self.streams]
+        self.index = []
+        self.file = open(path, "wb")
+        header = json.dumps(
+            {
+                "version": VERSION,
+                "board": board,
+                "chunk_rows": chunk_rows,
+                "compressor": compressor,
+                "streams": self.streams,
+                "groups": [dict(group) for group in groups],
+            }
+        ).encode()
+        self.file.write(MAGIC + HEADER.pack(len(header)) + header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def append(self, stream, columns, segments=()):
+        """appends the columns of a stream, segments are the scale segments of a rail from their start index in
+        the whole stream, the ones already known are ignored"""
+        known = self.segments[stream][-1]["start"] if self.segments[stream] else -1
+        self.segments[stream].extend(
+            dict(segment) for segment in segments if segment["start"] > known
+        )
+        self.pending[stream].append([np.asarray(column) for column in columns])
+        pending = sum(len(part[0]) for part in self.pending[stream])
+        if pending >= self.chunk_rows:
+            self.flush(stream, pending - pending % self.chunk_rows)
+
+    def flush(self, stream, rows=None):
+        """writes the first rows pending of a stream (all of them by default) as chunks"""
+        parts = self.pending[stream]
+        if not parts:
+            return
+        if len(parts) == 1:
+            columns = parts[0]
+        else:
+            columns = [np.concatenate(column) for column in zip(*parts)]
+        if rows is None:
+            rows = len(columns[0])
+        for start in range(0, rows, self.chunk_rows):
+            stop = min(start + self.chunk_rows, rows)
+            self.write_chunk(stream, [column[start:stop] for column in columns])
+        self.pending[stream] = (
+            [[column[rows:] for column in columns]] if rows < len(columns[0]) else []
+        )
+
+    def write_chunk(self, stream, columns):
+        rows = len(columns[0])
+        first = self.rows[stream]
+        segments = self.segments[stream]
+        local = []
+        for i, segment in enumerate(segments):
+            end = segments[i + 1]["start"] if i + 1 < len(segments) else None
+            if segment["start"] < first + rows and (end is None or end > first):
+                local.append(dict(segment, start=max(segment["start"] - first, 0)))
+        meta = json.dumps({"segments": local}).encode() if local else b""
+        dtypes = COLUMNS[self.streams[stream]["kind"]]
+        payload = b"".join(
+            np.ascontiguousarray(column, dtype=dtype).tobytes()
+            for column, (_, dtype) in zip(columns, dtypes)
+        )
+        if self.compressor == "zlib":
+            payload = zlib.compress(payload, 1)
+        chunk = {
+            "stream": stream,
+            "offset": self.file.tell(),
+            "rows": rows,
+            "first": float(columns[0][0]),
+            "last": float(columns[0][-1]),
+        }
+        if local:
+            chunk["segments"] = local
+        self.index.append(chunk)
+        self.file.write(
+            CHUNK.pack(
+                CHUNK_MAGIC,
+                stream,
+                COMPRESSORS[self.compressor],
+                rows,
+                len(meta),
+                len(payload),
+            )
+            + meta
+            + payload
+        )
+        self.rows[stream] += rows
+
+    def close(self):
+        """writes the chunks pending, the index and the trailer"""
+        if self.file.closed:
+            return
+        for stream in range(len(self.streams)):
+            self.flush(stream)
+        offset = self.file.tell()
+        index = json.dumps(self.index).encode()
+        self.file.write(INDEX_MAGIC + HEADER.pack(len(index)) + index)
+        self.file.write(TRAILER.pack(offset, TRAILER_MAGIC))
+        self.file.close()
+
+
+class CaptureReader:
+    """memory maps a capture and reads its header and chunk index, the chunks are read on demand"""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        if self.file.read(len(MAGIC)) != MAGIC:
+            self.file.close()
+            raise ValueError(path + " is not a PMT capture file")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (length,) = HEADER.unpack_from(self.map, len(MAGIC))
+        self.data_start = len(MAGIC) + HEADER.size + length
+        self.header = json.loads(self.map[len(MAGIC) + HEADER.size : self.data_start])
+        if self.header["version"] > VERSION:
+            self.file.close()
+            raise ValueError(
+                path + " has an unsupported version %d" % self.header["version"]
+            )
+        self.cache = {}  # decompressed payloads by chunk offset
+        self.index = self.read_index()
+        if self.index is None:
+            self.index = self.scan()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read_index(self):
+        if len(self.map) - self.data_start < TRAILER.size:
+            return None
+        offset, magic = TRAILER.unpack_from(self.map, len(self.map) - TRAILER.size)
+        if magic != TRAILER_MAGIC:
+            return None
+        if self.map[offset : offset + len(INDEX_MAGIC)] != INDEX_MAGIC:
+            return None
+        offset += len(INDEX_MAGIC)
+        (length,) = HEADER.unpack_from(self.map, offset)
+        offset += HEADER.size
+        return json.loads(self.map[offset : offset + length])
+
+    def scan(self):
+        """rebuilds the index of a capture without trailer, up to its last complete chunk"""
+        index = []
+        offset = self.data_start
+        while offset + CHUNK.size <= len(self.map):
+            magic, stream, _, rows, meta, payload = CHUNK.unpack_from(self.map, offset)
+            end = offset + CHUNK.size + meta + payload
+            if magic != CHUNK_MAGIC or end > len(self.map):
+                break
+            chunk = {"stream": stream, "offset": offset, "rows": rows}
+            time = self.read_chunk(chunk)[0]
+            chunk["first"], chunk["last"] = float(time[0]), float(time[-1])
+            chunk["segments"] = self.read_segments(chunk)
+            index.append(chunk)
+            offset = end
+        return index
+
+    def chunks(self, stream):
+        """returns the index entries of the chunks of a stream"""
+        return [chunk for chunk in self.index if chunk["stream"] == stream]
+
+    def read_segments(self, chunk):
+        """returns the scale segments of a rail chunk, from its index entry or its meta"""
+        if "segments" in chunk:
+            return chunk["segments"]
+        _, _, _, _, meta, _ = CHUNK.unpack_from(self.map, chunk["offset"])
+        start = chunk["offset"] + CHUNK.size
+        return json.loads(self.map[start : start + meta])["segments"] if meta else []
+
+    def read_chunk(self, chunk):
+        """returns the columns of a chunk, read only views of the mapped file when not compressed"""
+        offset = chunk["offset"]
+        _, stream, compressor, rows, meta, payload = CHUNK.unpack_from(self.map, offset)
+        pos = offset + CHUNK.size + meta
+        if compressor == COMPRESSORS["zlib"]:
+            if offset not in self.cache:
+                if len(self.cache) >= CACHED_CHUNKS:
+                    del self.cache[next(iter(self.cache))]
+                self.cache[offset] = zlib.decompress(self.map[pos : pos + payload])
+            buffer, pos = self.cache[offset], 0
+        else:
+            buffer = self.map
+        columns = []
+        for _, dtype in COLUMNS[self.header["streams"][stream]["kind"]]:
+            column = np.frombuffer(buffer, dtype, rows, pos)
+            columns.append(column)
+            pos += column.nbytes
+        return columns
+
+    def close(self):
+        """closes the file, the mapping is released with the last column read from it"""
+        self.file.close()
+
+
+class MappedColumn:
+    """column of a stream read from the chunks of a capture on access, sliced and searched like the view of a
+    GrowableArray"""
+
+    def __init__(self, reader, stream, column):
+        self.reader = reader
+        self.chunks = reader.chunks(stream)
+        self.column = column
+        self.dtype = np.dtype(
+            COLUMNS[reader.header["streams"][stream]["kind"]][column][1]
+        )
+        self.starts = np.cumsum([0] + [chunk["rows"] for chunk in self.chunks])
+        self.lasts = np.array([chunk["last"] for chunk in self.chunks])
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[:], dtype=dtype)
+
+    def view(self):
+        return self
+
+    def chunk(self, i):
+        return self.reader.read_chunk(self.chunks[i])[self.column]
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            key = int(key) + len(self) if key < 0 else int(key)
+            if not 0 <= key < len(self):
+                raise IndexError(key)
+            i = self.starts.searchsorted(key, "right") - 1
+            return self.chunk(i)[key - self.starts[i]]
+        start, stop, step = key.indices(len(self))
+        if stop <= start:
+            return np.empty(0, self.dtype)
+        first = self.starts.searchsorted(start, "right") - 1
+        last = self.starts.searchsorted(stop)
+        parts = [
+            self.chunk(i)[max(start - self.starts[i], 0) : stop - self.starts[i]]
+            for i in range(first, last)
+        ]
+        values = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        return values[::step]
+
+    def searchsorted(self, values, side="left"):
+        """searches sorted times like ndarray.searchsorted, in the chunks their last time points at"""
+        scalar = np.ndim(values) == 0
+        values = np.atleast_1d(values)
+        positions = np.empty(len(values), dtype=np.int64)
+        chunks = self.lasts.searchsorted(values, side)
+        for i, (value, chunk) in enumerate(zip(values, chunks)):
+            positions[i] = self.starts[chunk]
+            if chunk < len(self.chunks):
+                positions[i] += self.chunk(chunk).searchsorted(value, side)
+        return positions[0] if scalar else positions
+
+
+class MappedSums(data_buffer.PrefixSums):
+    """PrefixSums of a mapped stream, from the sums and areas of its complete summary blocks"""
+
+    def __init__(self, time, values, sums, areas=None):
+        data_buffer.PrefixSums.__init__(
+            self, time, values, areas is not None, SUMMARY_BLOCK
+        )
+        self.sums.append(np.cumsum(sums))
+        if areas is not None:
+            self.areas.append(np.cumsum(areas))
+        self.count = len(time)
+
+
+class LazyLevel:
+    """rows of a level of a MappedPyramid below the summary blocks, decimated from the samples when read"""
+
+    def __init__(self, pyramid, level):
+        self.pyramid = pyramid
+        self.level = level
+
+    def __len__(self):
+        return len(self.pyramid.time) // self.pyramid.factor ** (self.level + 1)
+
+    def view(self):
+        return self.pyramid.block_rows(self.level, 0, len(self))
+
+
+class MappedPyramid(data_buffer.MinMaxPyramid):
+    """MinMaxPyramid of a mapped stream, its levels from the summary blocks up are kept in memory and the finer
+    ones are decimated from the samples of the drawn window"""
+
+    def __init__(self, time, values, blocks):
+        super().__init__(time, values)
+        block = self.factor ** (SUMMARY_LEVEL + 1)
+        count = len(time)
+        complete = count // block
+        tail = data_buffer.MinMaxPyramid(None, None, self.factor)
+        tail.append(time[complete * block :], values(complete * block, count))
+        self.levels = [LazyLevel(self, level) for level in range(SUMMARY_LEVEL)]
+        self.levels.append(data_buffer.GrowableArray(blocks[:complete]))
+        self.pending = tail.pending[: SUMMARY_LEVEL + 1]
+        self.pending += [np.empty((0, 3))] * (SUMMARY_LEVEL + 1 - len(self.pending))
+        self.decimate(blocks[:complete], SUMMARY_LEVEL + 1)
+
+    def block_rows(self, level, first, last):
+        """returns the [time, min, max] rows first to last of a level below the summary blocks"""
+        block = self.factor ** (level + 1)
+        values = self.values(first * block, last * block).reshape(-1, block)
+        return np.column_stack(
+            (
+                self.time[first * block : last * block : block],
+                values.min(1),
+                values.max(1),
+            )
+        )
+
+    def window(self, minx, maxx, pixels):
+        time = self.time.view()
+        positions = time.searchsorted((minx, maxx))
+        start, stop = max(positions[0] - 1, 0), min(positions[1] + 1, len(time))
+        level = self.level(stop - start, pixels)
+        if not level or level > SUMMARY_LEVEL:
+            return super().window(minx, maxx, pixels)
+        # rows starting before minx and maxx, as searched in the rows of a stored level
+        complete = len(self.levels[level - 1])
+        first, last = np.minimum(-(-positions // self.factor**level), complete)
+        rows = self.block_rows(level - 1, max(first - 1, 0), min(last + 1, complete))
+        if last == complete:
+            rows = np.concatenate((rows, self.tail(level)))
+        return np.repeat(rows[:, 0], 2), rows[:, 1:].ravel()
+
+    def rows(self, level, start, stop):
+        if 0 <= level < SUMMARY_LEVEL:
+            return self.block_rows(level, start, stop)[:, 1:]
+        return super().rows(level, start, stop)
+
+
+def summarize(time, values, previous=None):
+    """returns the summary columns of samples starting at a block boundary, values being the arrays of the keys
+    with the power last, previous the time and power of the sample before them if any"""
+    starts = np.arange(0, len(time), SUMMARY_BLOCK)
+    columns = [np.asarray(time[starts], dtype=np.float64)]
+    for key_values in values:
+        columns += [
+            np.minimum.reduceat(key_values, starts),
+            np.maximum.reduceat(key_values, starts),
+            np.add.reduceat(key_values, starts),
+            np.add.reduceat(key_values * key_values, starts),
+        ]
+    power = values[-1]
+    prev_t, prev_p = previous if previous is not None else (time[0], power[0])
+    steps = np.diff(time, prepend=prev_t) * (power + np.append(prev_p, power[:-1]))
+    columns.append(np.add.reduceat(steps / 2, starts))
+    return columns
+
+
+def summarize_stream(time, functions, piece=SUMMARY_PIECE):
+    """yields the summary columns of a stream piece by piece, functions returning the values start to stop of
+    each key"""
+    for start in range(0, len(time), piece):
+        stop = min(start + piece, len(time))
+        previous = None
+        if start:
+            previous = (time[start - 1], functions[-1](start - 1, start)[0])
+        yield summarize(
+            time[start:stop],
+            [function(start, stop) for function in functions],
+            previous,
+        )
+
+
+def mapped_history(reader, time, functions, summary):
+    """returns the stats, sums and pyramid of each key of a mapped stream, from its summary stream or from its
+    samples without summary"""
+    if summary is None:
+        parts = list(summarize_stream(time, list(functions.values())))
+        columns = [np.concatenate(column) for column in zip(*parts)]
+        if not columns:
+            columns = [np.empty(0)] * (2 + len(SUMMARY_STATS) * len(functions))
+    else:
+        kind = reader.header["streams"][summary]["kind"]
+        columns = [
+            MappedColumn(reader, summary, i)[:] for i in range(len(COLUMNS[kind]))
+        ]
+    stats, sums, pyramids = {}, {}, {}
+    for i, (key, function) in enumerate(functions.items()):
+        low, high, total, sum_sq = columns[1 + i * 4 : 5 + i * 4]
+        stats[key] = data_buffer.RunningStats()
+        stats[key].merge(
+            len(time),
+            float(total.sum()),
+            float(sum_sq.sum()),
+            float(low.min()) if len(low) else np.inf,
+            float(high.max()) if len(high) else -np.inf,
+        )
+        complete = len(time) // SUMMARY_BLOCK
+        sums[key] = MappedSums(
+            time,
+            function,
+            total[:complete],
+            columns[-1][:complete] if key == "power" else None,
+        )
+        pyramids[key] = MappedPyramid(
+            time, function, np.column_stack((columns[0], low, high))
+        )
+    return stats, sums, pyramids
+
+
+class MappedRail(data_buffer.RailHistory):
+    """RailHistory of a rail of a capture, its codes read from the mapped chunks on demand"""
+
+    def __init__(self, reader, stream, summary=None):
+        self.name = reader.header["streams"][stream]["name"]
+        self.time = MappedColumn(reader, stream, 0)
+        self.vbus = MappedColumn(reader, stream, 1)
+        self.vsense = MappedColumn(reader, stream, 2)
+        self.segments = []
+        for start, chunk in zip(self.time.starts, self.time.chunks):
+            for segment in reader.read_segments(chunk):
+                last = self.segments[-1] if self.segments else None
+                if last is None or any(
+                    last[key] != segment[key]
+                    for key in ("rsense", "bipolar", "hw_filter")
+                ):
+                    self.segments.append(
+                        dict(segment, start=int(start) + segment["start"])
+                    )
+        self.stats, self.sums, self.pyramids = mapped_history(
+            reader,
+            self.time,
+            {"voltage": self.voltage, "current": self.current, "power": self.power},
+            summary,
+        )
+
+
+class MappedGroup:
+    """power of a group of a capture read from the mapped chunks on demand, used like a GroupHistory"""
+
+    def __init__(self, reader, stream, summary=None):
+        self.name = reader.header["streams"][stream]["name"]
+        self.time = MappedColumn(reader, stream, 0)
+        self.power = MappedColumn(reader, stream, 1)
+        stats, sums, pyramids = mapped_history(
+            reader,
+            self.time,
+            {"power": lambda start, stop: self.power[start:stop]},
+            summary,
+        )
+        self.stats = stats["power"]
+        self.sums = sums["power"]
+        self.pyramid = pyramids["power"]
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, key):
+        if key == "group_name":
+            return self.name
+        if key == "power":
+            return np.column_stack((self.time[:], self.power[:]))
+        raise KeyError(key)
+
+
+def is_capture(path):
+    """returns True if path is a chunked capture, False for a pickled one"""
+    with open(path, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def write_histories(
+    path, board, rails, groups, temperature=None, progress=None, **kwargs
+):
+    """writes the RailHistory rails, the GroupHistory groups with their summaries and the [time, value]
+    temperature samples. progress is called with the fraction written after each piece of a stream, the
+    file is removed and False returned if it does not return True."""
+    streams = [{"name": rail.name, "kind": "rail"} for rail in rails]
+    streams += [{"name": group.name, "kind": "group"} for group in groups]
+    if temperature is not None:
+        streams.append({"name": "temperature", "kind": "temperature"})
+    temperature_stream = len(streams) - 1
+    histories = [(rail, [rail.voltage, rail.current, rail.power]) for rail in rails] + [
+        (group, [lambda start, stop, group=group: group.power.view()[start:stop]])
+        for group in groups
+    ]
+    summaries = len(streams)
+    for stream, (history, _) in enumerate(histories):
+        streams.append(
+            {
+                "name": history.name,
+                "kind": streams[stream]["kind"] + "_summary",
+                "stream": stream,
+                "block": SUMMARY_BLOCK,
+            }
+        )
+    groups = [
+        {"name": group.name, "rails": [rail.name for rail in group.rails]}
+        for group in groups
+    ]
+    total = 2 * sum(len(history) for history, _ in histories)
+    written = 0
+    done = True
+    with CaptureWriter(path, board, streams, groups, **kwargs) as writer:
+        for stream, (history, _) in enumerate(histories):
+            if stream < len(rails):
+                columns = (
+                    history.time.view(),
+                    history.vbus.view(),
+                    history.vsense.view(),
+                )
+                segments = history.segments
+            else:
+                columns = (history.time.view(), history.power.view())
+                segments = ()
+            for start in range(0, len(history), SUMMARY_PIECE):
+                if not done:
+                    break
+                piece = [column[start : start + SUMMARY_PIECE] for column in columns]
+                writer.append(stream, piece, segments)
+                written += len(piece[0])
+                if progress is not None:
+                    done = progress(written / total)
+        if done and temperature is not None and len(temperature):
+            temperature = np.asarray(temperature, dtype=np.float64)
+            writer.append(temperature_stream, (temperature[:, 0], temperature[:, 1]))
+        for stream, (history, functions) in enumerate(histories, summaries):
+            starts = range(0, len(history), SUMMARY_PIECE)
+            for start, columns in zip(
+                starts, summarize_stream(history.time.view(), functions)
+            ):
+                if not done:
+                    break
+                writer.append(stream, columns)
+                written += min(SUMMARY_PIECE, len(history) - start)
+                if progress is not None:
+                    done = progress(written / total)
+    if not done:
+        os.remove(path)
+    return done
+
+
+def open_capture(path):
+    """returns the header, MappedRail rails, MappedGroup groups and temperature samples (None if not recorded)
+    of a capture, the groups missing from it being computed from the rails"""
+    reader = CaptureReader(path)
+    streams = reader.header["streams"]
+    summaries = {
+        stream["stream"]: i
+        for i, stream in enumerate(streams)
+        if stream["kind"].endswith("_summary") and stream.get("block") == SUMMARY_BLOCK
+    }
+    rails, groups = [], []
+    temperature = None
+    for i, stream in enumerate(streams):
+        if stream["kind"] == "rail":
+            rails.append(MappedRail(reader, i, summaries.get(i)))
+        elif stream["kind"] == "group":
+            groups.append(MappedGroup(reader, i, summaries.get(i)))
+        elif stream["kind"] == "temperature":
+            temperature = np.column_stack(
+                (MappedColumn(reader, i, 0)[:], MappedColumn(reader, i, 1)[:])
+            )
+    mapped = {group.name for group in groups}
+    by_name = {rail.name: rail for rail in rails}
+    for group in reader.header["groups"]:
+        if group["name"] not in mapped:
+            groups.append(
+                data_buffer.GroupHistory(
+                    group["name"], [by_name[name] for name in group["rails"]]
+                )
+            )
+            groups[-1].update()
+    return reader.header, rails, groups, temperature
+
+
+def read_legacy(path):
+    """returns the rail_buf, groups_buf and temperature_buf (None if not recorded) pickled in a .pmt file of the
+    previous versions"""
+    groups_buf = []
+    temperature_buf = None
+    with open(path, "rb") as file:
+        rail_buf = pickle.load(file)
+        try:
+            groups_buf = pickle.load(file)
+            temperature_buf = pickle.load(file)
+        except EOFError:
+            pass
+    return rail_buf, groups_buf, temperature_buf
@@ -29,12 +29,24 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 import logging
+import math
+import os
 import platform
 import time
 
 import ftdi_def as ft_def
+import program_config
 
-if platform.system() == "Linux":
+FTDI_BACKEND = os.environ.get("PMT_FTDI_BACKEND", program_config.FTDI_BACKEND)
+if FTDI_BACKEND == "sim":
+    import ftdi_sim as sim_backend
+
+    OS = "Sim"
+elif FTDI_BACKEND == "replay":
+    import ftdi_record as sim_backend
+
+    OS = "Sim"
+elif platform.system() == "Linux":
     import pylibftdi
 
     OS = "Linux"
@@ -43,6 +55,12 @@ elif platform.system() == "Windows":
 
     OS = "Windows"
 
+FTDI_READ_TIMEOUT = 0.1  # max time in sec to wait for the expected bytes from the FTDI
+FTDI_READ_RETRY_DELAY = 0.0001  # time in sec between two reads of the missing bytes
+FTDI_READ_STATS = {"reads": 0, "retries": 0, "timeouts": 0}
+SEND_IMMEDIATE = bytes([ft_def.MPSSE_CMD_SEND_IMMEDIATE])
+RECORDER = None
+
 
 def ftdi_i2c_init(ftdi_device, pins):
     """low-level I2C initialization"""
@@ -82,108 +100,133 @@ def ftdi_i2c_init(ftdi_device, pins):
     ftdic_write(ftdi_device, buf_to_send)
 
 
+class I2cCmdTemplates:
+    """MPSSE I2C commands precompiled for one (dir_bitmask, val_bitmask) pin setup"""
+
+    def __init__(self, dir_bitmask, val_bitmask):
+        sda_out = ft_def.DIRECTION_SCLOUT_SDAOUT | dir_bitmask
+        sda_in = ft_def.DIRECTION_SCLOUT_SDAIN | dir_bitmask
+        scl_low = bytes(
+            [
+                ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE,
+                ft_def.VALUE_SCLLOW_SDALOW | val_bitmask,
+                sda_out,
+            ]
+        )
+        self.start = (
+            bytes(
+                [
+                    ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE,
+                    ft_def.VALUE_SCLHIGH_SDAHIGH | val_bitmask,  # SCL high, SDA high
+                    sda_out,
+                    ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE,
+                    ft_def.VALUE_SCLHIGH_SDALOW | val_bitmask,  # SCL high, SDA low
+                    sda_out,
+                ]
+            )
+            + scl_low
+        )  # SCL low, SDA low
+        self.stop = scl_low + bytes(
+            [
+                ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE,
+                ft_def.VALUE_SCLHIGH_SDALOW | val_bitmask,  # SCL high, SDA low
+                sda_out,
+                ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE,
+                ft_def.VALUE_SCLHIGH_SDAHIGH | val_bitmask,  # SCL high, SDA high
+                sda_out,
+            ]
+        )
+        # only the data byte changes between writes, so all 256 of them are built once
+        write_head = scl_low + bytes(
+            [ft_def.MPSSE_CMD_DATA_OUT_BITS_NEG_EDGE, ft_def.DATA_SIZE_8BITS]
+        )
+        write_tail = (
+            bytes(
+                [
+                    ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE,
+                    ft_def.VALUE_SCLLOW_SDALOW | val_bitmask,
+                    sda_in,
+                    ft_def.MPSSE_CMD_DATA_IN_BITS_POS_EDGE,
+                    ft_def.DATA_SIZE_1BIT,
+                ]
+            )
+            + scl_low
+        )
+        self.write = tuple(
+            write_head + bytes([data]) + write_tail for data in range(256)
+        )
+        read_byte = (
+            bytes(
+                [
+                    ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE,
+                    ft_def.VALUE_SCLLOW_SDALOW | val_bitmask,
+                    sda_in,
+                    ft_def.MPSSE_CMD_DATA_IN_BITS_POS_EDGE,
+                    ft_def.DATA_SIZE_8BITS,
+                ]
+            )
+            + scl_low
+            + bytes([ft_def.MPSSE_CMD_DATA_OUT_BITS_NEG_EDGE, 0x00])
+        )
+        self.read_ack = read_byte + b"\x00"
+        self.read_nack = read_byte + b"\xff"
+        self.reads = {}
+
+    def read(self, length):
+        """returns the commands reading length bytes, the last one NACKed"""
+        cmd = self.reads.get(length)
+        if cmd is None:
+            cmd = self.read_ack * (length - 1) + self.read_nack
+            self.reads[length] = cmd
+        return cmd
+
+
+I2C_CMD_TEMPLATES = {}
+
+
+def i2c_cmd_templates(pins):
+    """returns the cached I2C command templates matching the FTDI pins configuration"""
+    key = (pins["ftdi"][1], pins["ftdi"][2])
+    templates = I2C_CMD_TEMPLATES.get(key)
+    if templates is None:
+        templates = I2cCmdTemplates(*key)
+        I2C_CMD_TEMPLATES[key] = templates
+    return templates
+
+
 def ftdi_i2c_stop(ftdi_device, pins):
     """low-level I2C stop"""
     logging.debug("ftdi_i2c_stop")
-    val_bitmask = pins["ftdi"][2]
-    dir_bitmask = pins["ftdi"][1]
-    buf = []
-    buf.append(ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE)
-    buf.append(ft_def.VALUE_SCLLOW_SDALOW | val_bitmask)  # SCL low, SDA low
-    buf.append(ft_def.DIRECTION_SCLOUT_SDAOUT | dir_bitmask)
-    buf.append(ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE)
-    buf.append(ft_def.VALUE_SCLHIGH_SDALOW | val_bitmask)  # SCL high, SDA low
-    buf.append(ft_def.DIRECTION_SCLOUT_SDAOUT | dir_bitmask)
-    buf.append(ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE)
-    buf.append(ft_def.VALUE_SCLHIGH_SDAHIGH | val_bitmask)  # SCL high, SDA high
-    buf.append(ft_def.DIRECTION_SCLOUT_SDAOUT | dir_bitmask)
-    buf_to_send = bytes(buf)
-    ftdic_write(ftdi_device, buf_to_send)
+    ftdic_write(ftdi_device, i2c_cmd_templates(pins).stop)
 
 
 def ftdi_i2c_read(ftdi_device, pins, is_nack):
     """low-level I2C read"""
     logging.debug("ftdi_i2c_read")
-    val_bitmask = pins["ftdi"][2]
-    dir_bitmask = pins["ftdi"][1]
-    buf = []
-    buf.append(ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE)
-    buf.append(ft_def.VALUE_SCLLOW_SDALOW | val_bitmask)
-    buf.append(ft_def.DIRECTION_SCLOUT_SDAIN | dir_bitmask)
-    buf.append(ft_def.MPSSE_CMD_DATA_IN_BITS_POS_EDGE)
-    buf.append(ft_def.DATA_SIZE_8BITS)
-    buf.append(ft_def.MPSSE_CMD_SEND_IMMEDIATE)
-    buf.append(ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE)
-    buf.append(ft_def.VALUE_SCLLOW_SDALOW | val_bitmask)
-    buf.append(ft_def.DIRECTION_SCLOUT_SDAOUT | dir_bitmask)
-    buf.append(ft_def.MPSSE_CMD_DATA_OUT_BITS_NEG_EDGE)
-    buf.append(0x00)
+    templates = i2c_cmd_templates(pins)
     if is_nack:
-        buf.append(0x80)
+        buf = templates.read_nack
     else:
-        buf.append(0x00)
-    buf_to_send = bytes(buf)
-    ftdic_write(ftdi_device, buf_to_send)
-    time.sleep(0.0001)
-    receive = ftdi_device.read(1)
+        buf = templates.read_ack
+    ftdic_write(ftdi_device, buf + SEND_IMMEDIATE)
+    receive = ftdic_read(ftdi_device, 1)
     return receive
 
 
 def ftdi_i2c_read_buffer(ftdi_device, pins, len):
     """low-level I2C read"""
     logging.debug("ftdi_i2c_read_buffer")
-    val_bitmask = pins["ftdi"][2]
-    dir_bitmask = pins["ftdi"][1]
-    buf = []
-    for j in range(len):
-        buf.append(ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE)
-        buf.append(ft_def.VALUE_SCLLOW_SDALOW | val_bitmask)
-        buf.append(ft_def.DIRECTION_SCLOUT_SDAIN | dir_bitmask)
-        buf.append(ft_def.MPSSE_CMD_DATA_IN_BITS_POS_EDGE)
-        buf.append(ft_def.DATA_SIZE_8BITS)
-        buf.append(ft_def.MPSSE_CMD_SEND_IMMEDIATE)
-        buf.append(ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE)
-        buf.append(ft_def.VALUE_SCLLOW_SDALOW | val_bitmask)
-        buf.append(ft_def.DIRECTION_SCLOUT_SDAOUT | dir_bitmask)
-        buf.append(ft_def.MPSSE_CMD_DATA_OUT_BITS_NEG_EDGE)
-        buf.append(0x00)
-        if j < len - 1:
-            buf.append(0x00)
-        else:
-            buf.append(0xFF)
-    buf_to_send = bytes(buf)
-    ftdic_write(ftdi_device, buf_to_send)
-    time.sleep(0.0005)
-    receive = ftdi_device.read(len)
+    ftdic_write(ftdi_device, i2c_cmd_templates(pins).read(len) + SEND_IMMEDIATE)
+    receive = ftdic_read(ftdi_device, len)
     return receive
 
 
 def ftdi_i2c_write(ftdi_device, pins, data):
     """low-level I2C write"""
     logging.debug("ftdi_i2c_write")
-    val_bitmask = pins["ftdi"][2]
-    dir_bitmask = pins["ftdi"][1]
-    buf = []
-    buf.append(ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE)
-    buf.append(ft_def.VALUE_SCLLOW_SDALOW | val_bitmask)
-    buf.append(ft_def.DIRECTION_SCLOUT_SDAOUT | dir_bitmask)
-    buf.append(ft_def.MPSSE_CMD_DATA_OUT_BITS_NEG_EDGE)
-    buf.append(ft_def.DATA_SIZE_8BITS)
-    buf.append(data)
-    buf.append(ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE)
-    buf.append(ft_def.VALUE_SCLLOW_SDALOW | val_bitmask)
-    buf.append(ft_def.DIRECTION_SCLOUT_SDAIN | dir_bitmask)
-    buf.append(ft_def.MPSSE_CMD_DATA_IN_BITS_POS_EDGE)
-    buf.append(ft_def.DATA_SIZE_1BIT)
-    buf.append(ft_def.MPSSE_CMD_SEND_IMMEDIATE)
-    buf.append(ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE)
-    buf.append(ft_def.VALUE_SCLLOW_SDALOW | val_bitmask)
-    buf.append(ft_def.DIRECTION_SCLOUT_SDAOUT | dir_bitmask)
-    buf_to_send = bytes(buf)
-    ftdic_write(ftdi_device, buf_to_send)
-    time.sleep(0.0005)
-    in_buff = ftdi_device.read(1)
-    if (in_buff[0] & 0x01) != 0:
+    ftdic_write(ftdi_device, i2c_cmd_templates(pins).write[data] + SEND_IMMEDIATE)
+    in_buff = ftdic_read(ftdi_device, 1)
+    if not in_buff or (in_buff[0] & 0x01) != 0:
         logging.warning("Can't get ack after write!")
         return -1
     return 0
@@ -192,33 +235,78 @@ def ftdi_i2c_write(ftdi_device, pins, data):
 def ftdi_i2c_start(ftdi_device, pins):
     """low-level I2C start"""
     logging.debug("ftdi_i2c_start")
-    val_bitmask = pins["ftdi"][2]
-    dir_bitmask = pins["ftdi"][1]
-    buf = []
-    buf.append(ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE)
-    buf.append(ft_def.VALUE_SCLHIGH_SDAHIGH | val_bitmask)  # SCL high, SDA high
-    buf.append(ft_def.DIRECTION_SCLOUT_SDAOUT | dir_bitmask)
-    buf.append(ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE)
-    buf.append(ft_def.VALUE_SCLHIGH_SDALOW | val_bitmask)  # SCL high, SDA low
-    buf.append(ft_def.DIRECTION_SCLOUT_SDAOUT | dir_bitmask)
-    buf.append(ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE)
-    buf.append(ft_def.VALUE_SCLLOW_SDALOW | val_bitmask)  # SCL low, SDA low
-    buf.append(ft_def.DIRECTION_SCLOUT_SDAOUT | dir_bitmask)
-    buf_to_send = bytes(buf)
-    ftdic_write(ftdi_device, buf_to_send)
+    ftdic_write(ftdi_device, i2c_cmd_templates(pins).start)
+
+
+def ftdi_i2c_start_cmd(pins):
+    """returns MPSSE commands for an I2C start, without sending them"""
+    return i2c_cmd_templates(pins).start
+
+
+def ftdi_i2c_stop_cmd(pins):
+    """returns MPSSE commands for an I2C stop, without sending them"""
+    return i2c_cmd_templates(pins).stop
+
+
+def ftdi_i2c_write_cmd(pins, data):
+    """returns MPSSE commands writing one byte and reading its ACK bit, without sending them"""
+    return i2c_cmd_templates(pins).write[data]
+
+
+def ftdi_i2c_read_cmd(pins, length):
+    """returns MPSSE commands reading length bytes (last one NACKed), without sending them"""
+    return i2c_cmd_templates(pins).read(length)
+
+
+def ftdi_i2c_delay_cmd(delay):
+    """returns MPSSE commands keeping the I2C bus idle for at least delay seconds"""
+    # SCL is clocked while SDA stays high, no device sees it as a START or STOP condition
+    i2c_clock = 60000000 / ((1 + ft_def.CLOCK_DIVISOR_400K) * 2)
+    length = max(math.ceil(delay * i2c_clock / 8) - 1, 0)
+    return bytes(
+        [ft_def.MPSSE_CMD_CLOCK_N_BYTES_NO_DATA, length & 0xFF, (length >> 8) & 0xFF]
+    )
+
+
+def ftdi_i2c_transaction(ftdi_device, cmd, length):
+    """sends batched I2C commands in one USB write and reads back their ACK bits and data"""
+    logging.debug("ftdi_i2c_transaction")
+    ftdic_write(ftdi_device, cmd + SEND_IMMEDIATE)
+    return ftdic_read(ftdi_device, length)
 
 
 def ftdic_write(ftdi_device, buf):
-    """FTDI write function depending of the current OS"""
-    if OS == "Linux":
-        ftdi_device.write(bytes(buf))
-    elif OS == "Windows":
-        ftdi_device.write(buf)
+    """FTDI write function, buf is already a bytes object for both OS backends"""
+    ftdi_device.write(buf)
+
+
+def ftdic_read(ftdi_device, length):
+    """FTDI read function returning as soon as length bytes are received or on timeout"""
+    # pylibftdi returns what is available so the read is retried, ftd2xx blocks up to its timeout
+    FTDI_READ_STATS["reads"] += 1
+    receive = bytes(ftdi_device.read(length))
+    if len(receive) < length:
+        t_limit = time.time() + FTDI_READ_TIMEOUT
+        while len(receive) < length:
+            if time.time() > t_limit:
+                FTDI_READ_STATS["timeouts"] += 1
+                logging.warning(
+                    "FTDI read timeout: got "
+                    + str(len(receive))
+                    + " of "
+                    + str(length)
+                    + " bytes"
+                )
+                break
+            time.sleep(FTDI_READ_RETRY_DELAY)
+            FTDI_READ_STATS["retries"] += 1
+            receive += bytes(ftdi_device.read(length - len(receive)))
+    return receive
 
 
 def ftdic_write_gpio(ftdi_device, buf):
     """FTDI write gpio function depending of the current OS"""
-    if OS == "Linux":
+    if OS == "Linux" or OS == "Sim":
         ftdi_device.write(bytes([buf]))
     elif OS == "Windows":
         ftdi_device.write(bytes([buf]))
@@ -226,8 +314,8 @@ def ftdic_write_gpio(ftdi_device, buf):
 
 def ftdic_read_gpio(ftdi_device):
     """FTDI read depending function of the current OS"""
-    if OS == "Linux":
-        return ftdi_device.read(1)[0]
+    if OS == "Linux" or OS == "Sim":
+        return ftdic_read(ftdi_device, 1)[0]
     elif OS == "Windows":
         return ftdi_device.getBitMode()
 
@@ -235,7 +323,7 @@ def ftdic_read_gpio(ftdi_device):
 def ftdi_open(board_id, channel, desc=None):
     """opens FTDI device function depending of the current OS"""
     if OS == "Linux":
-        return pylibftdi.Device(device_index=board_id, interface_select=channel + 1)
+        device = pylibftdi.Device(device_index=board_id, interface_select=channel + 1)
     elif OS == "Windows":
         add = desc.get("location")
         dev_list = ftdi.listDevices()
@@ -248,7 +336,23 @@ def ftdi_open(board_id, channel, desc=None):
                         dev_channel = tmp_dev.get("index")
             else:
                 pass
-        return ftdi.open(dev_channel)
+        device = ftdi.open(dev_channel)
+        device.setTimeouts(int(FTDI_READ_TIMEOUT * 1000), int(FTDI_READ_TIMEOUT * 1000))
+    elif OS == "Sim":
+        device = sim_backend.open_device(board_id, channel)
+    if RECORDER:
+        return RECORDER.wrap(device, channel)
+    return device
+
+
+def ftdi_record_start(board_name):
+    """records the FTDI traffic of the devices opened from now on, if a record file is set"""
+    global RECORDER
+    path = os.environ.get("PMT_FTDI_RECORD_FILE", program_config.FTDI_RECORD_FILE)
+    if path and RECORDER is None:
+        import ftdi_record
+
+        RECORDER = ftdi_record.Recorder(path, board_name)
 
 
 def ftdic_setbitmode(ftdi_device, out_pins, value):
@@ -257,3 +361,5 @@ def ftdic_setbitmode(ftdi_device, out_pins, value):
         ftdi_device.ftdi_fn.ftdi_set_bitmode(out_pins, value)
     elif OS == "Windows":
         ftdi_device.setBitMode(out_pins, value)
+    elif OS == "Sim":
+        ftdi_device.set_bitmode(out_pins, value)
@@ -0,0 +1,227 @@
+# Copyright 2020-2022 NXP
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# Neither the name of the NXP Semiconductors nor the names of its
+# contributors may be used to endorse or promote products derived from this
+# software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""CSV export of the rail samples, built and written block by block while the capture runs, and its import"""
+
+import itertools
+import os
+import queue
+import threading
+
+import numpy as np
+
+import data_buffer
+
+TYPE_DATA = ["voltage", "current", "power"]
+TYPE_DATA_UNIT = [" (V)", " (mA)", " (mW)"]
+
+# number of lines parsed at once by read_csv and written at once by write_csv
+READ_BLOCK_ROWS = 65536
+WRITE_BLOCK_ROWS = 65536
+
+
+class CsvRows:
+    """rows of the CSV export on the timeline of a reference rail: the last sample of each rail at the row time,
+    the power of the groups interpolated at it and the last temperature before it"""
+
+    def __init__(self, reference, rails, groups, temperature=False):
+        self.reference = reference
+        self.rails = rails
+        self.groups = groups  # [name, rails] of each group
+        self.temperature = temperature
+        self.group_stats = {name: data_buffer.RunningStats() for name, _ in groups}
+        self.last = None  # time of the last row built
+
+    def headers(self):
+        headers = ["Time (ms)"]
+        for rail in self.rails:
+            for key, unit in zip(TYPE_DATA, TYPE_DATA_UNIT):
+                headers.append(rail.name + " " + key + unit)
+        for name, _ in self.groups:
+            headers.append(name + " power (mW)")
+        if self.temperature:
+            headers.append("Temperature (°C)")
+        return headers
+
+    def build(self, temperature=None, limit=None):
+        """returns the columns of the rows every rail covers since the previous build, limit rows at most,
+        None without new row. temperature gives the [time, value] rows read lately, the rows wait for the
+        first one."""
+        rails = [self.reference] + self.rails
+        rails += [rail for _, group in self.groups for rail in group]
+        if not all(len(rail) for rail in rails):
+            return None
+        if self.temperature and (temperature is None or not len(temperature)):
+            return None
+        timeline = self.reference.time.view()
+        start = 0 if self.last is None else timeline.searchsorted(self.last, "right")
+        stop = timeline.searchsorted(
+            min(rail.time.view()[-1] for rail in rails), "right"
+        )
+        if limit is not None:
+            stop = min(stop, start + limit)
+        if stop <= start:
+            return None
+        time = timeline[start:stop]
+        columns = [time]
+        for rail in self.rails:
+            index = np.maximum(rail.time.view().searchsorted(time, "right") - 1, 0)
+            low, high = index[0], index[-1] + 1
+            voltage = rail.voltage(low, high)[index - low]
+            current = rail.current(low, high)[index - low]
+            columns += [voltage, current, voltage * current]
+        for name, group in self.groups:
+            power = data_buffer.group_power(group, time)
+            self.group_stats[name].update(power)
+            columns.append(power)
+        if self.temperature:
+            index = temperature[:, 0].searchsorted(time, "right") - 1
+            columns.append(temperature[np.maximum(index, 0), 1])
+        self.last = time[-1]
+        return columns
+
+    def reset(self):
+        """restarts the rows and group stats, to follow the reset of the rails"""
+        self.last = None
+        for stats in self.group_stats.values():
+            stats.reset()
+
+
+class CsvWriter:
+    """writes a CSV file in a thread, the blocks of rows queued since its previous write being formatted and
+    flushed together"""
+
+    def __init__(self, path, headers, fmt="%1.4f"):
+        self.path = path
+        self.fmt = fmt
+        self.file = open(path, "w", encoding="utf-8")
+        self.file.write(",".join(headers) + "\n")
+        self.blocks = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, columns):
+        """queues the rows of columns"""
+        self.blocks.put(np.column_stack(columns))
+
+    def run(self):
+        done = False
+        while not done:
+            batch = [self.blocks.get()]
+            while not self.blocks.empty():
+                batch.append(self.blocks.get())
+            if batch[-1] is None:
+                batch.pop()
+                done = True
+            if batch:
+                np.savetxt(
+                    self.file, np.concatenate(batch), fmt=self.fmt, delimiter=","
+                )
+                self.file.flush()
+        self.file.close()
+
+    def close(self):
+        """writes the rows queued and closes the file"""
+        self.blocks.put(None)
+        self.thread.join()
+
+
+def write_csv(path, rows, temperature=None, progress=None):
+    """writes all the rows of a CSV export by blocks of WRITE_BLOCK_ROWS, progress being called with the
+    fraction of the reference timeline written after each block. The export goes on while progress returns
+    True, else the file is removed and False returned."""
+    timeline = rows.reference.time.view()
+    done = True
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(",".join(rows.headers()) + "\n")
+        while done:
+            columns = rows.build(temperature, WRITE_BLOCK_ROWS)
+            if columns is None:
+                break
+            np.savetxt(file, np.column_stack(columns), fmt="%1.4f", delimiter=",")
+            if progress is not None:
+                done = progress(
+                    timeline.searchsorted(rows.last, "right") / len(timeline)
+                )
+    if not done:
+        os.remove(path)
+    return done
+
+
+def read_csv(path):
+    """returns the rails, groups and temperature (None if not exported) of a CSV export, the numeric columns
+    being parsed by blocks of READ_BLOCK_ROWS lines"""
+    with open(path, encoding="utf-8", errors="replace") as file:
+        header = file.readline().rstrip("\n").split(",")
+        rails, groups, temperature = [], [], None
+        last = ""
+        for column, title in enumerate(header[1:], 1):
+            name = title.split(" ")[0]
+            if "Temperature" in name:
+                temperature = column
+            elif name == last:
+                continue
+            elif "GROUP" in name:
+                groups.append((name, column))
+            else:
+                rails.append((name, column))
+            last = name
+        usecols = [0]
+        for _, column in rails:
+            usecols += [column, column + 1]
+        usecols += [column for _, column in groups]
+        if temperature is not None:
+            usecols.append(temperature)
+        blocks = []
+        while True:
+            lines = list(itertools.islice(file, READ_BLOCK_ROWS))
+            if not lines:
+                break
+            blocks.append(np.loadtxt(lines, delimiter=",", usecols=usecols, ndmin=2))
+    data = np.concatenate(blocks) if blocks else np.empty((0, len(usecols)))
+    del blocks
+    time = data[:, 0]
+    first = np.zeros((1, 2))
+    rail_buf = []
+    for index, (name, _) in enumerate(rails):
+        voltage, current = data[:, 1 + 2 * index], data[:, 2 + 2 * index]
+        rail_buf.append(
+            {
+                "railnumber": name,
+                "voltage": np.vstack((first, np.column_stack((time, voltage)))),
+                "current": np.vstack((first, np.column_stack((time, current)))),
+            }
+        )
+    groups_buf = [
+        {"group_name": name, "power": data[:, [0, 1 + 2 * len(rails) + index]]}
+        for index, (name, _) in enumerate(groups)
+    ]
+    temperature_buf = None if temperature is None else data[:, [0, -1]]
+    return rail_buf, groups_buf, temperature_buf
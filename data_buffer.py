@@ -0,0 +1,620 @@
+# Copyright 2020-2022 NXP
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# Neither the name of the NXP Semiconductors nor the names of its
+# contributors may be used to endorse or promote products derived from this
+# software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""growable arrays keeping the rail histories of the GUI, TUI and server"""
+
+import numpy as np
+
+PAC1934_VBUS_LSB = 32 / 65535  # V
+PAC1934_VSENSE_LSB = 100000 / 65535  # uV, mA once divided by the shunt in mohm
+PAC1934_VSENSE_LSB_BIPOLAR = 100000 / 32768
+
+
+def codes_to_voltage(vbus):
+    """converts PAC VBUS codes to V"""
+    return vbus * PAC1934_VBUS_LSB
+
+
+def codes_to_current(vsense, rsense, bipolar):
+    """converts PAC VSENSE codes to mA through a shunt of rsense mohm, signed codes in bipolar mode"""
+    if bipolar:
+        return vsense.view(np.int16) * (PAC1934_VSENSE_LSB_BIPOLAR / rsense)
+    return vsense * (PAC1934_VSENSE_LSB / rsense)
+
+
+def vsense_to_codes(vsense, bipolar):
+    """converts VSENSE voltages in uV to the nearest PAC codes"""
+    if bipolar:
+        codes = np.clip(np.rint(vsense / PAC1934_VSENSE_LSB_BIPOLAR), -32768, 32767)
+        return codes.astype(np.int16).view(np.uint16)
+    return np.clip(np.rint(vsense / PAC1934_VSENSE_LSB), 0, 65535).astype(np.uint16)
+
+
+class GrowableArray:
+    """array with amortized O(1) appends, its storage doubling when full, read through a view of the filled rows"""
+
+    def __init__(self, rows, dtype=np.float64, capacity=4096):
+        rows = np.asarray(rows, dtype=dtype)
+        self.buffer = np.empty(
+            (max(capacity, len(rows)),) + rows.shape[1:], dtype=dtype
+        )
+        self.size = 0
+        self.append(rows)
+
+    def __len__(self):
+        return self.size
+
+    def view(self):
+        """returns the filled rows, without copy"""
+        return self.buffer[: self.size]
+
+    def append(self, rows):
+        """appends rows at the end of the array and returns the new view"""
+        rows = np.asarray(rows, dtype=self.buffer.dtype)
+        end = self.size + len(rows)
+        if end > len(self.buffer):
+            buffer = np.empty(
+                (max(end, 2 * len(self.buffer)),) + self.buffer.shape[1:],
+                dtype=self.buffer.dtype,
+            )
+            buffer[: self.size] = self.buffer[: self.size]
+            self.buffer = buffer
+        self.buffer[self.size : end] = rows
+        self.size = end
+        return self.view()
+
+    def reset(self, rows):
+        """replaces the content of the array by rows and returns the new view, in a new storage leaving the
+        snapshots unchanged"""
+        self.buffer = np.empty_like(self.buffer)
+        self.size = 0
+        return self.append(rows)
+
+    def snapshot(self):
+        """returns an array sharing the filled rows, the later appends and resets not changing them"""
+        array = GrowableArray.__new__(GrowableArray)
+        array.buffer = self.view()
+        array.size = self.size
+        return array
+
+    def truncate(self, size):
+        """drops the rows after size, keeping the storage"""
+        self.size = min(self.size, size)
+
+    def discard(self, count):
+        """drops the count first rows, moving the others to the front of the storage"""
+        count = min(count, self.size)
+        self.buffer[: self.size - count] = self.buffer[count : self.size]
+        self.size -= count
+
+
+class RunningStats:
+    """count, compensated sum, sum of squares, min and max of a stream of values, updated chunk by chunk"""
+
+    def __init__(self, values=()):
+        self.reset()
+        self.update(values)
+
+    def reset(self):
+        """forgets all the values"""
+        self.count = 0
+        self.total = 0.0
+        self.compensation = 0.0
+        self.sum_sq = 0.0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+
+    def update(self, values):
+        """adds a chunk of values"""
+        values = np.asarray(values, dtype=np.float64)
+        if not values.size:
+            return
+        self.merge(
+            values.size,
+            float(values.sum()),
+            float(np.dot(values, values)),
+            float(values.min()),
+            float(values.max()),
+        )
+
+    def merge(self, count, total, sum_sq, minimum, maximum):
+        """adds the count, sum, sum of squares, min and max of a chunk of values"""
+        if not count:
+            return
+        chunk = total
+        total = self.total + chunk
+        if abs(self.total) >= abs(chunk):
+            self.compensation += (self.total - total) + chunk
+        else:
+            self.compensation += (chunk - total) + self.total
+        self.total = total
+        self.count += count
+        self.sum_sq += sum_sq
+        self.minimum = min(self.minimum, minimum)
+        self.maximum = max(self.maximum, maximum)
+
+    def mean(self):
+        """returns the mean of the values, 0 without values"""
+        return (self.total + self.compensation) / self.count if self.count else 0.0
+
+
+class PrefixSums:
+    """cumulative sums of a stream of values per block of block samples, and optionally of their trapezoidal
+    integral over time, giving the mean and the integral of any window of samples from the blocks within it and
+    the values of the blocks partly in it"""
+
+    def __init__(self, time, values, integral=False, block=4096):
+        self.time = time  # GrowableArray of the samples time, filled by the owner
+        self.values = values  # returns the values of the samples start to stop
+        self.block = block
+        self.sums = GrowableArray(np.zeros(1))  # sums of the values before each block
+        self.areas = GrowableArray(np.zeros(1)) if integral else None
+        self.count = 0
+        self.total = 0.0  # sum of all the values
+        self.area = 0.0  # integral of all the values
+        self.last = None  # time and value of the sample before the next trapezoid
+
+    def __len__(self):
+        return self.count
+
+    def append(self, time, values):
+        """adds a chunk of values sampled at time"""
+        values = np.asarray(values, dtype=np.float64)
+        if not values.size:
+            return
+        start = self.count
+        self.count += len(values)
+        ends = np.arange(len(self.sums) * self.block, self.count + 1, self.block)
+        ends -= start
+        sums = self.total + np.cumsum(values)
+        self.sums.append(sums[ends - 1])
+        self.total = sums[-1]
+        if self.areas is not None:
+            time = np.asarray(time, dtype=np.float64)
+            prev_t, prev_v = self.last or (time[0], values[0])
+            steps = np.diff(time, prepend=prev_t) * (
+                values + np.append(prev_v, values[:-1])
+            )
+            areas = self.area + np.cumsum(steps / 2)
+            self.areas.append(areas[ends - 1])
+            self.area = areas[-1]
+            self.last = (time[-1], values[-1])
+
+    def reset(self):
+        """forgets all the values"""
+        self.sums.reset(np.zeros(1))
+        if self.areas is not None:
+            self.areas.reset(np.zeros(1))
+        self.count = 0
+        self.total = 0.0
+        self.area = 0.0
+        self.last = None
+
+    def blocks(self, start, stop):
+        """returns the first and last blocks within the samples start to stop"""
+        first = -(-start // self.block)
+        last = min(stop // self.block, len(self.sums) - 1)
+        return first, max(first, last)
+
+    def steps(self, start, stop):
+        """returns the trapezoids of the samples start to stop, each from the sample before it"""
+        if stop <= start:
+            return 0.0
+        low = max(start - 1, 0)
+        time = self.time.view()[low:stop]
+        values = self.values(low, stop)
+        return float(np.sum(np.diff(time) * (values[1:] + values[:-1]) / 2))
+
+    def mean(self, start, stop):
+        """returns the mean of the values start to stop"""
+        stop = min(stop, len(self))
+        if stop <= start:
+            return 0.0
+        first, last = self.blocks(start, stop)
+        if first == last:
+            return float(self.values(start, stop).sum()) / (stop - start)
+        sums = self.sums.view()
+        total = (
+            sums[last]
+            - sums[first]
+            + self.values(start, first * self.block).sum()
+            + self.values(last * self.block, stop).sum()
+        )
+        return float(total) / (stop - start)
+
+    def integral(self, start, stop):
+        """returns the integral over time of the values start to stop"""
+        stop = min(stop, len(self))
+        if stop - 1 <= start:
+            return 0.0
+        first, last = self.blocks(start + 1, stop)
+        if first == last:
+            return self.steps(start + 1, stop)
+        areas = self.areas.view()
+        return (
+            float(areas[last] - areas[first])
+            + self.steps(start + 1, first * self.block)
+            + self.steps(last * self.block, stop)
+        )
+
+
+class MinMaxPyramid:
+    """min/max decimation levels of a stream of samples, each level keeping [time, min, max] rows of blocks of
+    factor rows of the level below, to draw any time window with a bounded number of points without losing the
+    spikes"""
+
+    def __init__(self, time, values, factor=8):
+        self.time = time  # GrowableArray of the samples time, filled by the owner
+        self.values = values  # returns the values of the samples start to stop
+        self.factor = factor
+        self.levels = []  # rows of the complete blocks, the finest level first
+        self.pending = []  # rows of the level below not filling a block yet
+
+    def append(self, time, values):
+        """adds a chunk of samples"""
+        self.decimate(np.column_stack((time, values, values)), 0)
+
+    def decimate(self, rows, level):
+        """adds the rows of the level below level (the samples for 0) and the blocks they complete"""
+        while len(rows):
+            if level == len(self.levels):
+                self.levels.append(GrowableArray(np.empty((0, 3))))
+                self.pending.append(np.empty((0, 3)))
+            rows = np.concatenate((self.pending[level], rows))
+            full = len(rows) - len(rows) % self.factor
+            self.pending[level] = rows[full:]
+            blocks = rows[:full].reshape(-1, self.factor, 3)
+            rows = np.column_stack(
+                (blocks[:, 0, 0], blocks[:, :, 1].min(1), blocks[:, :, 2].max(1))
+            )
+            self.levels[level].append(rows)
+            level += 1
+
+    def reset(self):
+        """drops all the levels"""
+        self.levels = []
+        self.pending = []
+
+    def level(self, count, pixels):
+        """returns the finest level drawing count samples over pixels columns with at most one min/max pair per
+        column, 0 being the samples themselves"""
+        level, points = 0, count
+        while points > 2 * pixels and level < len(self.levels):
+            level += 1
+            points = 2 * count / self.factor**level
+        return level
+
+    def tail(self, level):
+        """returns the rows of the samples not yet in a complete block of level"""
+        return np.concatenate(self.pending[level - 1 :: -1])
+
+    def window(self, minx, maxx, pixels):
+        """returns the x and y drawing the samples from minx to maxx over pixels columns, from the finest level
+        giving at most one min/max pair per column"""
+        time = self.time.view()
+        start, stop = time.searchsorted((minx, maxx))
+        start, stop = max(start - 1, 0), min(stop + 1, len(time))
+        level = self.level(stop - start, pixels)
+        if not level:
+            return time[start:stop], self.values(start, stop)
+        rows = self.levels[level - 1].view()
+        first, last = rows[:, 0].searchsorted((minx, maxx))
+        rows = rows[max(first - 1, 0) : last + 1]
+        if last == len(self.levels[level - 1]):
+            rows = np.concatenate((rows, self.tail(level)))
+        return np.repeat(rows[:, 0], 2), rows[:, 1:].ravel()
+
+    def rows(self, level, start, stop):
+        """returns the [min, max] of the rows start to stop of a level, -1 being the samples"""
+        if level < 0:
+            values = self.values(start, stop)
+            return np.column_stack((values, values))
+        return self.levels[level].view()[start:stop, 1:]
+
+    def extrema(self, start, stop):
+        """returns the min and max of the samples start to stop, from the coarsest blocks covering them"""
+        parts = []
+        level = -1
+        while start < stop:
+            inner_start, inner_stop = -(-start // self.factor), stop // self.factor
+            if level + 1 < len(self.levels):
+                inner_stop = min(inner_stop, len(self.levels[level + 1]))
+            if level + 1 == len(self.levels) or inner_start >= inner_stop:
+                parts.append(self.rows(level, start, stop))
+                break
+            parts.append(self.rows(level, start, inner_start * self.factor))
+            parts.append(self.rows(level, inner_stop * self.factor, stop))
+            start, stop = inner_start, inner_stop
+            level += 1
+        parts = np.concatenate(parts) if parts else np.empty((0, 2))
+        if not len(parts):
+            return np.nan, np.nan
+        return parts[:, 0].min(), parts[:, 1].max()
+
+
+class DecimatedCurve:
+    """x and y of a curve drawing all the samples of a pyramid, extended with the rows added since the previous
+    update as long as the level fitting the plot width does not change"""
+
+    def __init__(self, pyramid):
+        self.pyramid = pyramid
+        self.level = None
+        self.x = GrowableArray(np.empty(0))
+        self.y = GrowableArray(np.empty(0))
+        self.count = 0  # samples of the pyramid at the previous update
+        self.done = 0  # rows of the level already drawn, without the tail
+
+    def update(self, pixels):
+        """returns the x and y drawing the samples over pixels columns"""
+        count = len(self.pyramid.time)
+        level = self.pyramid.level(count, pixels)
+        if level != self.level or count < self.count:
+            self.level = level
+            self.x.reset(np.empty(0))
+            self.y.reset(np.empty(0))
+            self.done = 0
+        self.count = count
+        if not level:
+            self.x.append(self.pyramid.time.view()[self.done : count])
+            self.y.append(self.pyramid.values(self.done, count))
+            self.done = count
+            return self.x.view(), self.y.view()
+        rows = self.pyramid.levels[level - 1].view()
+        self.x.truncate(2 * self.done)
+        self.y.truncate(2 * self.done)
+        for new in (rows[self.done :], self.pyramid.tail(level)):
+            self.x.append(np.repeat(new[:, 0], 2))
+            self.y.append(new[:, 1:].ravel())
+        self.done = len(rows)
+        return self.x.view(), self.y.view()
+
+
+class RailHistory:
+    """history of a rail kept as float64 timestamps and raw 16 bits PAC codes, with the scale segments converting
+    them on demand. Without index, the prefix sums and pyramids are not kept and the old samples can be
+    discarded, the stats still covering them."""
+
+    def __init__(self, name, indexed=True):
+        self.name = name
+        self.indexed = indexed
+        self.time = GrowableArray(np.empty(0), np.float64)
+        self.vbus = GrowableArray(np.empty(0), np.uint16)
+        self.vsense = GrowableArray(np.empty(0), np.uint16)
+        self.segments = []  # scale of the codes from their start index
+        self.stats = {
+            "voltage": RunningStats(),
+            "current": RunningStats(),
+            "power": RunningStats(),
+        }
+        self.sums = {}
+        self.pyramids = {}
+        if indexed:
+            self.sums = {
+                "voltage": PrefixSums(self.time, self.voltage),
+                "current": PrefixSums(self.time, self.current),
+                "power": PrefixSums(self.time, self.power, integral=True),
+            }
+            self.pyramids = {
+                "voltage": MinMaxPyramid(self.time, self.voltage),
+                "current": MinMaxPyramid(self.time, self.current),
+                "power": MinMaxPyramid(self.time, self.power),
+            }
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, key):
+        if key == "railnumber":
+            return self.name
+        raise KeyError(key)
+
+    def append(self, t, vbus, vsense, scale_ids, scales):
+        """appends samples, scale_ids giving the (rsense, bipolar, hw_filter) record of scales of each sample"""
+        if not len(t):
+            return
+        for pos in [0] + (np.flatnonzero(np.diff(scale_ids)) + 1).tolist():
+            rsense, bipolar, hw_filter = scales[scale_ids[pos]]
+            last = self.segments[-1] if self.segments else None
+            if (
+                last is None
+                or last["rsense"] != rsense
+                or last["bipolar"] != bipolar
+                or last["hw_filter"] != hw_filter
+            ):
+                self.segments.append(
+                    {
+                        "start": len(self) + pos,
+                        "rsense": rsense,
+                        "bipolar": bipolar,
+                        "hw_filter": hw_filter,
+                    }
+                )
+        self.time.append(t)
+        self.vbus.append(vbus)
+        self.vsense.append(vsense)
+        voltage = self.voltage(-len(t))
+        current = self.current(-len(t))
+        for key, values in (
+            ("voltage", voltage),
+            ("current", current),
+            ("power", voltage * current),
+        ):
+            self.stats[key].update(values)
+            if self.indexed:
+                self.sums[key].append(t, values)
+                self.pyramids[key].append(t, values)
+
+    def reset(self):
+        """drops all the samples"""
+        self.time.reset(np.empty(0))
+        self.vbus.reset(np.empty(0))
+        self.vsense.reset(np.empty(0))
+        self.segments = []
+        for stats in self.stats.values():
+            stats.reset()
+        for sums in self.sums.values():
+            sums.reset()
+        for pyramid in self.pyramids.values():
+            pyramid.reset()
+
+    def snapshot(self):
+        """returns a history without index of the samples appended so far, sharing their storage"""
+        rail = RailHistory(self.name, indexed=False)
+        rail.time = self.time.snapshot()
+        rail.vbus = self.vbus.snapshot()
+        rail.vsense = self.vsense.snapshot()
+        rail.segments = list(self.segments)
+        return rail
+
+    def discard(self, t):
+        """drops the samples older than t but the last one, for a history without index"""
+        count = max(self.time.view().searchsorted(t, side="right") - 1, 0)
+        if not count:
+            return
+        for column in (self.time, self.vbus, self.vsense):
+            column.discard(count)
+        first = max(
+            i for i, segment in enumerate(self.segments) if segment["start"] <= count
+        )
+        self.segments = [
+            dict(segment, start=max(segment["start"] - count, 0))
+            for segment in self.segments[first:]
+        ]
+
+    def voltage(self, start=0, stop=None):
+        """returns the voltage in V of the samples start to stop"""
+        return codes_to_voltage(self.vbus.view()[start:stop])
+
+    def current(self, start=0, stop=None):
+        """returns the current in mA of the samples start to stop"""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        vsense = self.vsense.view()
+        current = np.empty(max(stop - start, 0))
+        for i, segment in enumerate(self.segments):
+            end = (
+                self.segments[i + 1]["start"]
+                if i + 1 < len(self.segments)
+                else len(self)
+            )
+            low, high = max(start, segment["start"]), min(stop, end)
+            if low < high:
+                current[low - start : high - start] = codes_to_current(
+                    vsense[low:high], segment["rsense"], segment["bipolar"]
+                )
+        return current
+
+    def power(self, start=0, stop=None):
+        """returns the power in mW of the samples start to stop"""
+        return self.voltage(start, stop) * self.current(start, stop)
+
+
+def group_power(rails, time):
+    """returns the summed power in mW of rails, each interpolated at the sorted time from its samples around it"""
+    power = np.zeros(len(time))
+    if not len(time):
+        return power
+    for rail in rails:
+        if not len(rail):
+            continue
+        rail_time = rail.time.view()
+        low, high = rail_time.searchsorted((time[0], time[-1]))
+        low, high = max(low - 1, 0), min(high + 1, len(rail))
+        power += np.interp(time, rail_time[low:high], rail.power(low, high))
+    return power
+
+
+class GroupHistory:
+    """power of a group of rails on the timeline of its first rail, extended with the samples every rail covers,
+    read like a groups_buf entry: group["power"] are [time, power] rows"""
+
+    def __init__(self, name, rails):
+        self.name = name
+        self.rails = rails
+        self.start = None  # index of the first rail sample starting the group
+        self.time = GrowableArray(np.empty(0), np.float64)
+        self.power = GrowableArray(np.empty(0), np.float64)
+        self.stats = RunningStats()
+        self.sums = PrefixSums(
+            self.time, lambda start, stop: self.power.view()[start:stop], True
+        )
+        self.pyramid = MinMaxPyramid(
+            self.time, lambda start, stop: self.power.view()[start:stop]
+        )
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, key):
+        if key == "group_name":
+            return self.name
+        if key == "power":
+            return np.column_stack((self.time.view(), self.power.view()))
+        raise KeyError(key)
+
+    def update(self):
+        """adds the samples of the first rail that are now covered by every rail"""
+        if not all(len(rail) for rail in self.rails):
+            return
+        reference = self.rails[0].time.view()
+        if self.start is None:
+            self.start = reference.searchsorted(
+                max(rail.time.view()[0] for rail in self.rails)
+            )
+        first = self.start + len(self)
+        last = reference.searchsorted(
+            min(rail.time.view()[-1] for rail in self.rails), side="right"
+        )
+        if last <= first:
+            return
+        time = reference[first:last]
+        power = group_power(self.rails, time)
+        self.time.append(time)
+        self.power.append(power)
+        self.stats.update(power)
+        self.sums.append(time, power)
+        self.pyramid.append(time, power)
+
+    def snapshot(self, rails):
+        """returns the group of the samples computed so far on the snapshots of its rails, sharing their
+        storage, its stats, sums and pyramid being left empty"""
+        group = GroupHistory(self.name, rails)
+        group.start = self.start
+        group.time = self.time.snapshot()
+        group.power = self.power.snapshot()
+        return group
+
+    def reset(self):
+        """drops all the samples, to follow the reset of the rails"""
+        self.start = None
+        self.time.reset(np.empty(0))
+        self.power.reset(np.empty(0))
+        self.stats.reset()
+        self.sums.reset()
+        self.pyramid.reset()
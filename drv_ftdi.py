@@ -38,6 +38,7 @@ import importlib.util
 import numpy as np
 import common_function as common_func
 from board_configuration import common
+import data_buffer
 import eeprom
 import program_config
 from main import LOG_LEVEL
@@ -51,8 +52,86 @@ FLAG_UI_STOP = False
 FLAG_PAUSE_CAPTURE = False
 T_START = 0
 
+PAC1934_ADDR_REG_REFRESH = 0x00
+PAC1934_ADDR_REG_CTRL = 0x01
+PAC1934_ADDR_REG_ACC_COUNT = 0x02
 PAC1934_ADDR_REG_VBUS = 0x07
 PAC1934_ADDR_REG_VBUS_AVG = 0x0F
+PAC1934_ADDR_REG_REFRESH_G = 0x1E
+I2C_GENERAL_CALL_ADDR = 0x00
+PAC1934_REFRESH_DELAY = 0.001  # registers are updated 1 ms after a REFRESH command
+# CTRL register sample rate bits for each number of conversions per second
+PAC1934_SAMPLE_RATES = {1024: 0b00, 256: 0b01, 64: 0b10, 8: 0b11}
+PAC1934_CTRL_SING = 0x10  # single-shot mode, one conversion cycle per REFRESH
+PAC1934_ACC_BLOCK_SIZE = 43  # ACC_COUNT, VPOWER_ACC, VBUS and VSENSE registers
+
+
+class SampleStore:
+    """ring buffers of the timestamps and raw VBUS / VSENSE codes of each rail, written once by the acquisition
+    thread and read by any number of subscribers, each one from its own cursor"""
+
+    def __init__(self, names, capacity):
+        self.names = names
+        self.capacity = capacity
+        self.time = np.zeros((len(names), capacity))
+        self.vbus = np.zeros((len(names), capacity), dtype=np.uint16)
+        self.vsense = np.zeros((len(names), capacity), dtype=np.uint16)
+        self.scale = np.zeros((len(names), capacity), dtype=np.uint16)
+        self.count = np.zeros(len(names), dtype=np.int64)
+        self.scales = []  # (rsense, bipolar, hw_filter) converting the codes
+        self.scale_ids = {}
+
+    def scale_id(self, rsense, bipolar, hw_filter):
+        """returns the index of a scale record in scales, adding it if new"""
+        scale = (rsense, bipolar, hw_filter)
+        if scale not in self.scale_ids:
+            self.scale_ids[scale] = len(self.scales)
+            self.scales.append(scale)
+        return self.scale_ids[scale]
+
+    def write(self, slots, t, vbus, vsense, scale):
+        """stores a sample at time t for each rail slot, DATA_LOCK being held"""
+        pos = self.count[slots] % self.capacity
+        self.time[slots, pos] = t
+        self.vbus[slots, pos] = vbus
+        self.vsense[slots, pos] = vsense
+        self.scale[slots, pos] = scale
+        self.count[slots] += 1
+
+    def read(self, slot, start, stop):
+        """returns copies of the time / VBUS / VSENSE / scale id samples start to stop of a rail, overwritten ones
+        excluded"""
+        start = max(start, stop - self.capacity)
+        index = np.arange(start, stop) % self.capacity
+        return (
+            self.time[slot, index],
+            self.vbus[slot, index],
+            self.vsense[slot, index],
+            self.scale[slot, index],
+        )
+
+    def subscribe(self):
+        """returns the cursor of a new subscriber, the count of samples it has read per rail"""
+        return self.count.copy()
+
+    def fetch(self, cursor):
+        """returns the samples of every rail written since the cursor and moves it, DATA_LOCK being held"""
+        lost = self.count - cursor - self.capacity
+        if (lost > 0).any():
+            logging.warning(
+                str(int(lost.max()))
+                + " samples dropped, not read within the retention window"
+            )
+        samples = [
+            self.read(slot, cursor[slot], self.count[slot])
+            for slot in range(len(self.names))
+        ]
+        cursor[:] = self.count
+        return samples
+
+    def skip(self, cursor):
+        """moves the cursor after the samples already written, DATA_LOCK being held"""
+        cursor[:] = self.count
 
 
 def load_library(board_name):
@@ -82,14 +161,27 @@ class Board:
         self.board_mapping_gpio = None
         self.boot_modes = None
         self.ftdic = None
+        self.ftdi_pool = {}
+        self.ftdi_desc = None
         self.temperature_sensor = None
         self.name = None
         self.id = None
-        self.data_buf = []
+        self.samples = None
         self.temp_buf = []
+        self.energy = {}  # rail name -> [energy (mJ), time (s)], in accumulator mode
         self.dev_list_num_i2c = None
         self.dev_list_num_gpio = None
         self.params = {"hw_filter": False, "bipolar": False}
+        self.pac_rates = {}  # PAC number -> conversions per second
+        self.pac_period = {}  # PAC number -> min time between two reads
+        self.pac_next_read = {}
+        self.scan_plan = []
+        self.mux_masks = {}
+        self.mux_dirty = True
+        self.scan_vbus = None
+        self.scan_vsense = None
+        self.scan_scale = None
+        self.scale_key = None
         self.eeprom = eeprom.FTDIEeprom(args)
         if (
             self.args.command == "eeprom"
@@ -188,6 +280,7 @@ class Board:
             )
             sys.exit()
         print("Done.")
+        common_func.ftdi_record_start(self.name)
         self.board_c = load_library(self.name)
         if self.board_c is None:
             print("Board " + self.name + " is not supported... Leaving")
@@ -234,6 +327,20 @@ class Board:
             self.board_mapping_power = sorted(
                 self.board_mapping_power, key=lambda i: (i["pac"][2], i["pac"][0])
             )
+            # checked before the acquisition thread programs the PACs
+            for rail in self.board_mapping_power:
+                rate = self.pac_sample_rate(rail["pac"][2])
+                if rate not in PAC1934_SAMPLE_RATES:
+                    logging.error(
+                        "PAC sample rate "
+                        + str(rate)
+                        + " is not supported, use 1024, 256, 64 or 8... Leaving"
+                    )
+                    sys.exit()
+            self.samples = SampleStore(
+                [rail["name"] for rail in self.board_mapping_power],
+                int(program_config.SAMPLE_RETENTION * max(PAC1934_SAMPLE_RATES)),
+            )
             print("Done.")
 
     def lsbootmode(self):
@@ -251,20 +358,6 @@ class Board:
             print("- " + gpio_name["name"])
 
     def get_all_board(self):
-        boards_def = {
-            "NXP i.MX8DXL EVK Board": "imx8dxlevk",
-            "NXP i.MX8DXL EVK DDR3 Board": "imx8dxlevkddr3",
-            "NXP i.MX8MP EVK Board": "imx8mpevk",
-            "NXP i.MX8MP EVK PWR Board": "imx8mpevkpwr",
-            "NXP i.MX8MP DDR3L Board": "imx8mpddr3l",
-            "NXP i.MX8MP DDR4 Board": "imx8mpddr4",
-            "NXP i.MX8ULP EVK Board": "imx8ulpevk",
-            "NXP i.MX8ULP EVK9 Board": "imx8ulpevk9",
-            "NXP VAL_BOARD_1 Board": "val_board_1",
-            "NXP VAL_BOARD_2 Board": "val_board_2",
-            "NXP i.MX93 EVK Board": "imx93evk11",
-            "NXP i.MX95 EVK Board": "imx95evk19",
-        }
         boards_infos = []
         dev_list = self.eeprom.list_eeprom_devices()
         for ind in range(len(dev_list)):
@@ -274,7 +367,7 @@ class Board:
                     self.eeprom.init_system(desc, ind)
                     board_id, board_rev = self.eeprom.read_eeprom_board_id_rev(pins)
                     self.eeprom.deinit()
-                    board_id = boards_def.get(board_id, "Unknown")
+                    board_id = common.board_eeprom_names.get(board_id, "Unknown")
                     if board_id != "Unknown":
                         if board_rev != "Unknown" and board_id not in [
                             "imx8dxlevk",
@@ -292,7 +385,7 @@ class Board:
                 self.eeprom.init_system(desc, ind)
                 board_id, board_rev = self.eeprom.read_eeprom_board_id_rev()
                 self.eeprom.deinit()
-                board_id = boards_def.get(board_id, "Unknown")
+                board_id = common.board_eeprom_names.get(board_id, "Unknown")
                 if board_id != "Unknown":
                     if board_rev != "Unknown" and board_id not in [
                         "imx8dxlevk",
@@ -341,6 +434,15 @@ class Board:
         common_func.ftdi_i2c_write(self.ftdic, pins, change_channel_cmd)
         common_func.ftdi_i2c_stop(self.ftdic, pins)
 
+    def pca9548_set_channel_cmd(self, pins):
+        """returns the I2C commands setting the channel of the PCA, to batch with other transactions"""
+        return (
+            common_func.ftdi_i2c_start_cmd(pins)
+            + common_func.ftdi_i2c_write_cmd(pins, pins["pca9548"][1] << 1)
+            + common_func.ftdi_i2c_write_cmd(pins, 1 << pins["pca9548"][0])
+            + common_func.ftdi_i2c_stop_cmd(pins)
+        )
+
     def pca_write(self, pins, gpio_value):
         """I2C communication for writing new value to the PCA"""
         output_data = []
@@ -562,38 +664,54 @@ class Board:
         logging.debug("modified GPIO configuration: " + hex(current_output))
 
     def deinit_system(self):
-        """closes FTDI interaction"""
-        self.ftdic.close()
+        """releases the current FTDI handle, it stays open in the pool for next calls"""
+        self.ftdic = None
+
+    def close_system(self):
+        """closes all the FTDI handles kept open in the pool"""
+        for device in self.ftdi_pool.values():
+            device["ftdic"].close()
+        self.ftdi_pool.clear()
+        self.ftdic = None
 
     def init_system(self, pins):
-        """initialization of the FTDI chip"""
+        """initialization of the FTDI chip, reusing the handle opened for the same channel and mode"""
         mode = (
             1
             if pins in self.board_mapping_gpio_i2c or pins in self.board_mapping_power
             else 0
         )
         channel = pins["ftdi"][0]
-        out_pins = 0
-        logging.info("FTDI Initialization...")
-        dev_list = self.eeprom.list_eeprom_devices()
-        __, desc = self.eeprom.detect_type(self.id, dev_list[self.id])
-        self.ftdic = common_func.ftdi_open(self.id, channel, desc)
-        if mode == 0:  # if GPIO mode
-            for (
-                gpio
-            ) in (
-                self.board_mapping_gpio
-            ):  # if channel 0, parse gpio default value of channel 0
-                if gpio["ftdi"][0] == channel:
-                    out_pins += gpio["ftdi"][1]
-                    common_func.ftdic_setbitmode(self.ftdic, 0xFF, 0x1)
-        if mode == 1:  # if I2C mode
-            common_func.ftdic_setbitmode(self.ftdic, 0x0, 0x00)  # reset the controller
-            common_func.ftdic_setbitmode(self.ftdic, 0x0, 0x02)  # set as MPSSE
+        key = (self.id, channel, mode)
+        device = self.ftdi_pool.get(key)
+        if device is None:
+            # a channel can only be opened once, drop its handle configured in the other mode
+            other_key = (self.id, channel, 1 - mode)
+            if other_key in self.ftdi_pool:
+                self.ftdi_pool.pop(other_key)["ftdic"].close()
+            logging.info("FTDI Initialization...")
+            if self.ftdi_desc is None:
+                dev_list = self.eeprom.list_eeprom_devices()
+                __, self.ftdi_desc = self.eeprom.detect_type(self.id, dev_list[self.id])
+            device = {
+                "ftdic": common_func.ftdi_open(self.id, channel, self.ftdi_desc),
+                "i2c_pins": None,
+            }
+            self.ftdi_pool[key] = device
+            if mode == 0:  # if GPIO mode
+                common_func.ftdic_setbitmode(device["ftdic"], 0xFF, 0x1)
+            if mode == 1:  # if I2C mode
+                common_func.ftdic_setbitmode(
+                    device["ftdic"], 0x0, 0x00
+                )  # reset the controller
+                common_func.ftdic_setbitmode(device["ftdic"], 0x0, 0x02)  # set as MPSSE
+            logging.info("Done.")
+        self.ftdic = device["ftdic"]
+        if mode == 1 and device["i2c_pins"] != (pins["ftdi"][1], pins["ftdi"][2]):
             common_func.ftdi_i2c_init(
                 self.ftdic, pins
             )  # Init FT4232H MPSSE with correct parameters
-        logging.info("Done.")
+            device["i2c_pins"] = (pins["ftdi"][1], pins["ftdi"][2])
 
     def resume(self):
         print("start resuming / suspending...")
@@ -752,13 +870,14 @@ class Board:
             next_rsense = self.rails_to_display[rail_num]["rsense"][0]
             switch_res_permitted = True
         else:
-            sampling_rate = rail["current"].shape[0] / rail["current"][-1, 0]
-            number_of_val = int(sampling_rate / 3)
             cur_limit = (100 / self.rails_to_display[rail_num]["rsense"][1]) * 1000
             cur_limit *= 1 - (program_config.LOW_SWITCH_RESISTANCE_OFFSET / 100)
-            DATA_LOCK.acquire()
-            avg_current = rail["current"][-number_of_val:, 1].mean(0)
-            DATA_LOCK.release()
+            rail_time = rail.time.view()
+            if not len(rail_time):
+                return False, False
+            avg_current = rail.current(
+                rail_time.searchsorted(rail_time[-1] - 1 / 3)
+            ).mean()
             if avg_current > cur_limit:
                 return False, switch_res_permitted
             else:
@@ -800,6 +919,8 @@ class Board:
                         self.rails_to_display[rail_num]["pac"][5],
                         self.rails_to_display[rail_num]["pac"][2],
                     )
+                self.build_scan_plan()
+                self.pac_set_ctrl()
                 return True, switch_res_permitted
 
     def init_res(self, rail):
@@ -849,167 +970,392 @@ class Board:
     def pac_set_bipolar(self):
         self.params["bipolar"] = not self.params["bipolar"]
         FTDI_LOCK.acquire()
-        for index, rail in enumerate(self.board_mapping_power):
-            if rail["pac"][2] != self.board_mapping_power[index - 1]["pac"][2]:
-                if rail.get("pca9548"):
-                    self.pca9548_set_channel(rail)
-                add_write = rail["pac"][1] << 1
-                common_func.ftdi_i2c_start(self.ftdic, rail)
-                common_func.ftdi_i2c_write(self.ftdic, rail, add_write)
-                common_func.ftdi_i2c_write(self.ftdic, rail, 0x1D)
-                if self.params["bipolar"]:
-                    common_func.ftdi_i2c_write(self.ftdic, rail, 0xF0)
-                else:
-                    common_func.ftdi_i2c_write(self.ftdic, rail, 0x00)
-                    common_func.ftdi_i2c_stop(self.ftdic, rail)
+        for step in self.scan_plan:
+            if step["mux"]:
+                self.pca9548_set_channel(step["pins"])
+            add_write = step["addr"] << 1
+            common_func.ftdi_i2c_start(self.ftdic, step["pins"])
+            common_func.ftdi_i2c_write(self.ftdic, step["pins"], add_write)
+            common_func.ftdi_i2c_write(self.ftdic, step["pins"], 0x1D)
+            if self.params["bipolar"]:
+                common_func.ftdi_i2c_write(self.ftdic, step["pins"], 0xF0)
+            else:
+                common_func.ftdi_i2c_write(self.ftdic, step["pins"], 0x00)
+            common_func.ftdi_i2c_stop(self.ftdic, step["pins"])
+        self.mux_dirty = True
         FTDI_LOCK.release()
 
+    def pac_sample_rate(self, pac):
+        """returns the sample rate of a PAC, from command line or program_config"""
+        if getattr(self.args, "rate", None):
+            return int(self.args.rate)
+        rates = program_config.PAC_SAMPLE_RATES.get(
+            self.name, program_config.PAC_SAMPLE_RATE
+        )
+        if isinstance(rates, dict):
+            return rates.get(pac, program_config.PAC_SAMPLE_RATE)
+        return rates
+
+    def pac_set_ctrl(self):
+        """writes the sample rate and the single-shot mode in the CTRL register of every PAC"""
+        single_shot = program_config.PAC_SINGLE_SHOT or getattr(
+            self.args, "single_shot", False
+        )
+        if single_shot and program_config.PAC_ACCUMULATOR_MODE:
+            logging.warning("Single-shot mode is not available with accumulators")
+            single_shot = False
+        FTDI_LOCK.acquire()
+        for step in self.scan_plan:
+            if step["pac"] in self.pac_rates:
+                continue
+            rate = self.pac_sample_rate(step["pac"])
+            self.pac_rates[step["pac"]] = rate
+            self.pac_period[step["pac"]] = 0 if single_shot else 1 / rate
+            ctrl = PAC1934_SAMPLE_RATES[rate] << 6
+            if single_shot:
+                ctrl |= PAC1934_CTRL_SING
+            pins = step["pins"]
+            cmd = b""
+            acks = 3
+            if step["mux"]:
+                cmd += self.pca9548_set_channel_cmd(pins)
+                acks += 2
+            cmd += (
+                common_func.ftdi_i2c_start_cmd(pins)
+                + common_func.ftdi_i2c_write_cmd(pins, step["addr"] << 1)
+                + common_func.ftdi_i2c_write_cmd(pins, PAC1934_ADDR_REG_CTRL)
+                + common_func.ftdi_i2c_write_cmd(pins, ctrl)
+                + common_func.ftdi_i2c_stop_cmd(pins)
+            )
+            out = common_func.ftdi_i2c_transaction(self.ftdic, cmd, acks)
+            if any(ack & 0x01 for ack in out[:acks]):
+                logging.warning("Can't get ack from PAC " + hex(step["addr"]))
+        self.mux_dirty = True
+        FTDI_LOCK.release()
+
+    def pac_ready(self, pac):
+        """tells if the PAC has done a new conversion since its last read, then books it"""
+        now = time.time()
+        if now < self.pac_next_read.get(pac, 0):
+            return False
+        self.pac_next_read[pac] = now + self.pac_period[pac]
+        return True
+
+    def wait_conversion(self):
+        """sleeps until the next conversion of the fastest PAC"""
+        delay = min(self.pac_next_read.values(), default=0) - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
     def pac_hw_filter(self):
         self.params["hw_filter"] = not self.params["hw_filter"]
 
-    def process_current(self, current):
-        if self.params["bipolar"]:
-            if current >= 32768:
-                return (current - 65536) / 32768 * 100000
-            else:
-                return current / 32768 * 100000
+    def block_read(self, step, select_mux=False):
+        """PAC block read, without REFRESH, batched in a single USB transaction with the PCA9548 channel selection if needed,
+        decoded in scan_vbus / scan_vsense"""
+        if self.params["hw_filter"]:
+            register = PAC1934_ADDR_REG_VBUS_AVG
         else:
-            return current / 65535 * 100000
+            register = PAC1934_ADDR_REG_VBUS
+        pins = step["pins"]
+        add_write = (step["addr"] << 1) + 0
+        add_read = (step["addr"] << 1) + 1
+        cmd = b""
+        acks = 3
+        if select_mux and step["mux"]:
+            cmd += self.pca9548_set_channel_cmd(pins)
+            acks += 2
+        cmd += (
+            common_func.ftdi_i2c_start_cmd(pins)
+            + common_func.ftdi_i2c_write_cmd(pins, add_write)
+            + common_func.ftdi_i2c_write_cmd(pins, register)
+            + common_func.ftdi_i2c_start_cmd(pins)
+            + common_func.ftdi_i2c_write_cmd(pins, add_read)
+            + common_func.ftdi_i2c_read_cmd(pins, 16)
+            + common_func.ftdi_i2c_stop_cmd(pins)
+        )
+        out = common_func.ftdi_i2c_transaction(self.ftdic, cmd, acks + 16)
+        if any(ack & 0x01 for ack in out[:acks]):
+            logging.warning("Can't get ack from PAC " + hex(step["addr"]))
+        self.decode_block(out[acks:], step)
 
-    def block_read(self, pins, index, rail_of_pac):
-        """I2C communication for PAC block read and return list of voltage / current"""
-        data = []
-        voltage = []
-        current = []
+    def pac_refresh_g(self, mux_masks):
+        """REFRESH_G general call reaching all the PACs at once, every used PCA9548 channel being enabled"""
+        pins = self.board_mapping_power[0]
+        cmd = b""
+        for mux_addr, mask in mux_masks.items():
+            cmd += (
+                common_func.ftdi_i2c_start_cmd(pins)
+                + common_func.ftdi_i2c_write_cmd(pins, mux_addr << 1)
+                + common_func.ftdi_i2c_write_cmd(pins, mask)
+                + common_func.ftdi_i2c_stop_cmd(pins)
+            )
+        cmd += (
+            common_func.ftdi_i2c_start_cmd(pins)
+            + common_func.ftdi_i2c_write_cmd(pins, I2C_GENERAL_CALL_ADDR)
+            + common_func.ftdi_i2c_write_cmd(pins, PAC1934_ADDR_REG_REFRESH_G)
+            + common_func.ftdi_i2c_stop_cmd(pins)
+            + common_func.ftdi_i2c_delay_cmd(PAC1934_REFRESH_DELAY)
+        )
+        acks = 2 * len(mux_masks) + 2
+        out = common_func.ftdi_i2c_transaction(self.ftdic, cmd, acks)
+        if any(ack & 0x01 for ack in out[:acks]):
+            logging.warning("Can't get ack for the PAC REFRESH_G general call")
+
+    def refresh_block_read(self, step, select_mux=False):
+        """REFRESH and block read of the current PAC batched in a single USB transaction, with the PCA9548 channel selection if needed,
+        decoded in scan_vbus / scan_vsense"""
         if self.params["hw_filter"]:
             register = PAC1934_ADDR_REG_VBUS_AVG
         else:
             register = PAC1934_ADDR_REG_VBUS
-        add_write = (pins["pac"][1] << 1) + 0
-        add_read = (pins["pac"][1] << 1) + 1
-        common_func.ftdi_i2c_start(self.ftdic, pins)
-        common_func.ftdi_i2c_write(self.ftdic, pins, add_write)
-        common_func.ftdi_i2c_write(self.ftdic, pins, register)
-        common_func.ftdi_i2c_start(self.ftdic, pins)
-        common_func.ftdi_i2c_write(self.ftdic, pins, add_read)
-        data = common_func.ftdi_i2c_read_buffer(self.ftdic, pins, 16)
-        for i in range(rail_of_pac):
-            channel = self.board_mapping_power[i + index]["pac"][0]
-            volt = (
-                ((data[(2 * channel) - 2] << 8) + data[(2 * channel) - 1]) * 32
-            ) / 65535
+        pins = step["pins"]
+        add_write = (step["addr"] << 1) + 0
+        add_read = (step["addr"] << 1) + 1
+        cmd = b""
+        acks = 5
+        if select_mux and step["mux"]:
+            cmd += self.pca9548_set_channel_cmd(pins)
+            acks += 2
+        cmd += (
+            common_func.ftdi_i2c_start_cmd(pins)
+            + common_func.ftdi_i2c_write_cmd(pins, add_write)
+            + common_func.ftdi_i2c_write_cmd(pins, PAC1934_ADDR_REG_REFRESH)
+            + common_func.ftdi_i2c_stop_cmd(pins)
+            + common_func.ftdi_i2c_delay_cmd(PAC1934_REFRESH_DELAY)
+            + common_func.ftdi_i2c_start_cmd(pins)
+            + common_func.ftdi_i2c_write_cmd(pins, add_write)
+            + common_func.ftdi_i2c_write_cmd(pins, register)
+            + common_func.ftdi_i2c_start_cmd(pins)
+            + common_func.ftdi_i2c_write_cmd(pins, add_read)
+            + common_func.ftdi_i2c_read_cmd(pins, 16)
+            + common_func.ftdi_i2c_stop_cmd(pins)
+        )
+        out = common_func.ftdi_i2c_transaction(self.ftdic, cmd, acks + 16)
+        if any(ack & 0x01 for ack in out[:acks]):
+            logging.warning("Can't get ack from PAC " + hex(step["addr"]))
+        self.decode_block(out[acks:], step)
+
+    def refresh_acc_read(self, step):
+        """REFRESH and read of the PAC accumulators, batched in a single USB transaction with the PCA9548 channel selection"""
+        pins = step["pins"]
+        add_write = (step["addr"] << 1) + 0
+        add_read = (step["addr"] << 1) + 1
+        cmd = b""
+        acks = 5
+        if step["mux"]:
+            cmd += self.pca9548_set_channel_cmd(pins)
+            acks += 2
+        cmd += (
+            common_func.ftdi_i2c_start_cmd(pins)
+            + common_func.ftdi_i2c_write_cmd(pins, add_write)
+            + common_func.ftdi_i2c_write_cmd(pins, PAC1934_ADDR_REG_REFRESH)
+            + common_func.ftdi_i2c_stop_cmd(pins)
+            + common_func.ftdi_i2c_delay_cmd(PAC1934_REFRESH_DELAY)
+            + common_func.ftdi_i2c_start_cmd(pins)
+            + common_func.ftdi_i2c_write_cmd(pins, add_write)
+            + common_func.ftdi_i2c_write_cmd(pins, PAC1934_ADDR_REG_ACC_COUNT)
+            + common_func.ftdi_i2c_start_cmd(pins)
+            + common_func.ftdi_i2c_write_cmd(pins, add_read)
+            + common_func.ftdi_i2c_read_cmd(pins, PAC1934_ACC_BLOCK_SIZE)
+            + common_func.ftdi_i2c_stop_cmd(pins)
+        )
+        out = common_func.ftdi_i2c_transaction(
+            self.ftdic, cmd, acks + PAC1934_ACC_BLOCK_SIZE
+        )
+        if any(ack & 0x01 for ack in out[:acks]):
+            logging.warning("Can't get ack from PAC " + hex(step["addr"]))
+        return self.decode_acc(
+            out[acks:], step["channels"], self.pac_rates[step["pac"]]
+        )
+
+    def decode_acc(self, data, channels, rate):
+        """converts the accumulator registers to lists of voltage / average current / energy and the integration time"""
+        # current and energy are multiplied by the shunt resistance, as the current of decode_block
+        voltage = []
+        current = []
+        energy = []
+        if len(data) < PAC1934_ACC_BLOCK_SIZE:
+            data = bytes(data) + bytes(PAC1934_ACC_BLOCK_SIZE - len(data))
+        count = int.from_bytes(data[0:3], "big")
+        duration = count / rate
+        for channel in channels:
+            acc = int.from_bytes(
+                data[6 * channel - 3 : 6 * channel + 3],
+                "big",
+                signed=self.params["bipolar"],
+            )
+            volt = int.from_bytes(data[25 + 2 * channel : 27 + 2 * channel], "big")
+            volt = volt * 32 / 65535
+            # VPOWER full scale is 3.2 W for 1 ohm, over 28 bits (27 bits + sign in bipolar mode)
+            full_scale = 2**27 if self.params["bipolar"] else 2**28
+            power = 3200000 * acc / count / full_scale if count else 0
             voltage.append(volt)
-            curr = self.process_current(
-                (((data[8 + (2 * channel) - 2] << 8) + data[8 + (2 * channel) - 1]) * 1)
+            current.append(power / volt if volt else 0)
+            energy.append(power * duration)
+        return voltage, current, energy, duration
+
+    def decode_block(self, data, step):
+        """extracts the VBUS / VSENSE codes of the step rails from the 16 bytes read from VBUS / VSENSE registers"""
+        if len(data) < 16:
+            data = bytes(data) + bytes(16 - len(data))
+        codes = np.frombuffer(data, ">u2", 8)
+        self.scan_vbus[step["slots"]] = codes[step["index"]]
+        self.scan_vsense[step["slots"]] = codes[step["index"] + 4]
+
+    def build_scan_plan(self):
+        """compiles board_mapping_power to the list of PAC reads done at each scan"""
+        # One step per PAC, with the channels to decode and the sample store index (slot) and shunt of each rail.
+        # The codes read in a scan are written at the rails slots of scan_vbus / scan_vsense.
+        # The PCA9548 channel is selected only by the steps whose channel differs from the previous step.
+        steps = {}
+        for index, rail in enumerate(self.board_mapping_power):
+            step = steps.setdefault(
+                rail["pac"][2],
+                {
+                    "pac": rail["pac"][2],
+                    "addr": rail["pac"][1],
+                    "pins": rail,
+                    "mux": rail.get("pca9548"),
+                    "channels": [],
+                    "slots": [],
+                    "rsense": [],
+                },
             )
-            current.append(curr)
-        return voltage, current
+            step["channels"].append(rail["pac"][0])
+            step["slots"].append(index)
+            step["rsense"].append(CURR_RSENSE[rail["name"]])
+        plan = list(steps.values())
+        mux_masks = {}
+        for i, step in enumerate(plan):
+            step["index"] = np.array(step["channels"]) - 1
+            step["rsense"] = np.array(step["rsense"], dtype=float)
+            step["select_mux"] = bool(step["mux"]) and (
+                len(plan) == 1 or step["mux"] != plan[i - 1]["mux"]
+            )
+            if step["mux"]:
+                mux_masks[step["mux"][1]] = mux_masks.get(step["mux"][1], 0) | (
+                    1 << step["mux"][0]
+                )
+        logging.debug(
+            "scan plan: "
+            + str(len(plan))
+            + " PAC reads for "
+            + str(len(self.board_mapping_power))
+            + " rails"
+        )
+        self.scan_plan = plan
+        self.mux_masks = mux_masks
+        if self.scan_vbus is None:
+            self.scan_vbus = np.zeros(len(self.board_mapping_power), dtype=np.uint16)
+            self.scan_vsense = np.zeros(len(self.board_mapping_power), dtype=np.uint16)
+            self.scan_scale = np.zeros(len(self.board_mapping_power), dtype=np.uint16)
+        self.scale_key = None
+        self.mux_dirty = True
+
+    def store_samples(self, slots, t_stop):
+        """writes the codes read for the slots in the sample store, DATA_LOCK being held"""
+        if FLAG_PAUSE_CAPTURE:
+            return
+        # the scale records only change with the shunts, the bipolar and the PAC average modes
+        scale_key = (self.params["bipolar"], self.params["hw_filter"])
+        if self.scale_key != scale_key:
+            for step in self.scan_plan:
+                for slot, rsense in zip(step["slots"], step["rsense"].tolist()):
+                    self.scan_scale[slot] = self.samples.scale_id(rsense, *scale_key)
+            self.scale_key = scale_key
+        self.samples.write(
+            slots,
+            t_stop - T_START,
+            self.scan_vbus[slots],
+            self.scan_vsense[slots],
+            self.scan_scale[slots],
+        )
 
     def get_data(self):
         """reads PAC while the app doesn't stop and update shared variable with power/voltage/current"""
         global T_START
-        rail_per_pac = {}
-        first_probe = True
         FTDI_LOCK.acquire()
         self.init_system(self.board_mapping_power[0])
-        for index, rail in enumerate(self.board_mapping_power):
+        for rail in self.board_mapping_power:
             self.init_res(rail)
-            self.data_buf.append(
-                {"railnumber": rail["name"], "current": [[0, 0]], "voltage": [[0, 0]]}
-            )
-            if len(self.board_mapping_power) == 1:
-                rail_of_pac = 1
-                rail_per_pac[rail["pac"][2]] = rail_of_pac
-            else:
-                if (
-                    rail["pac"][2] != self.board_mapping_power[index - 1]["pac"][2]
-                    or first_probe
-                ):
-                    first_probe = False
-                    rail_of_pac = 0
-                    for i in range(4):
-                        if index + i < len(self.board_mapping_power):
-                            if (
-                                self.board_mapping_power[index + i]["pac"][2]
-                                == rail["pac"][2]
-                            ):
-                                rail_of_pac += 1
-                            else:
-                                break
-                        else:
-                            break
-                    rail_per_pac[rail["pac"][2]] = rail_of_pac
+        self.build_scan_plan()
         FTDI_LOCK.release()
         self.pac_set_bipolar()
+        self.pac_set_ctrl()
+        if program_config.PAC_ACCUMULATOR_MODE:
+            self.scan_accumulators(store=False)  # clears the accumulators
         T_START = time.time()
         while not FLAG_UI_STOP:
             while FLAG_PAUSE_CAPTURE:
                 time.sleep(0.2)
-            for index, rail in enumerate(self.board_mapping_power):
-                if len(self.board_mapping_power) == 1:
-                    FTDI_LOCK.acquire()
-                    if rail.get("pca9548"):
-                        self.pca9548_set_channel(rail)
-                    self.reset_pac(rail)
-                    voltage, current = self.block_read(
-                        rail, index, rail_per_pac[rail["pac"][2]]
-                    )
-                    FTDI_LOCK.release()
-                    t_stop = time.time()
-                    DATA_LOCK.acquire()
-                    for i in range(rail_per_pac[rail["pac"][2]]):
-                        self.data_buf[index + i]["current"].append(
-                            [
-                                t_stop - T_START,
-                                current[i]
-                                / CURR_RSENSE[self.data_buf[index + i]["railnumber"]],
-                            ]
-                        )
-                        self.data_buf[index + i]["voltage"].append(
-                            [t_stop - T_START, voltage[i]]
-                        )
-                    DATA_LOCK.release()
-                else:
-                    # We check if the PAC of the current rail is different to the precedent rail, if yes then we can continue
-                    # the procedure for block read else continue to next rail.
-                    # Another case is if we have only different rails of the same PAC. In this case we continue the
-                    # procedure only if it is the first rail of the PAC.
-                    if rail["pac"][2] != self.board_mapping_power[index - 1]["pac"][
-                        2
-                    ] or (len(rail_per_pac) == 1 and index < 1):
-                        FTDI_LOCK.acquire()
-                        # We have to change the channel of the PCA if the current one is different to previous rail.
-                        # In all case we then proceed to reset the PAC with REFRESH command and do block read.
-                        if rail.get("pca9548") and self.board_mapping_power[
-                            index - 1
-                        ].get("pca9548"):
-                            if rail["pca9548"][0] != self.board_mapping_power[
-                                index - 1
-                            ]["pca9548"][0] or (len(rail_per_pac) == 1 and index < 1):
-                                self.pca9548_set_channel(rail)
-                        self.reset_pac(rail)
-                        voltage, current = self.block_read(
-                            rail, index, rail_per_pac[rail["pac"][2]]
-                        )
-                        FTDI_LOCK.release()
-                        t_stop = time.time()
-                        DATA_LOCK.acquire()
-                        for i in range(rail_per_pac[rail["pac"][2]]):
-                            if FLAG_PAUSE_CAPTURE:
-                                break
-                            self.data_buf[index + i]["current"].append(
-                                [
-                                    t_stop - T_START,
-                                    current[i]
-                                    / CURR_RSENSE[
-                                        self.data_buf[index + i]["railnumber"]
-                                    ],
-                                ]
-                            )
-                            self.data_buf[index + i]["voltage"].append(
-                                [t_stop - T_START, voltage[i]]
-                            )
-                        DATA_LOCK.release()
+            if program_config.PAC_ACCUMULATOR_MODE:
+                self.scan_accumulators()
+                time.sleep(program_config.PAC_ACCUMULATOR_PERIOD)
+                continue
+            self.wait_conversion()
+            if program_config.PAC_REFRESH_MODE == "general":
+                self.scan_refresh_g()
+            else:
+                self.scan_refresh()
+
+    def scan_refresh(self):
+        """reads every PAC of the scan plan just after its own REFRESH"""
+        for step in self.scan_plan:
+            # A PAC without new conversion is skipped, the PCA channel is then selected again by the next read.
+            if not self.pac_ready(step["pac"]):
+                self.mux_dirty = True
+                continue
+            FTDI_LOCK.acquire()
+            self.refresh_block_read(step, step["select_mux"] or self.mux_dirty)
+            self.mux_dirty = False
+            FTDI_LOCK.release()
+            t_stop = time.time()
+            DATA_LOCK.acquire()
+            self.store_samples(step["slots"], t_stop)
+            DATA_LOCK.release()
+
+    def scan_refresh_g(self):
+        """reads all the PACs after a single REFRESH_G, so every rail shares the same timestamp"""
+        slots = []
+        FTDI_LOCK.acquire()
+        self.pac_refresh_g(self.mux_masks)
+        t_stop = time.time()
+        for step in self.scan_plan:
+            if self.pac_ready(step["pac"]):
+                self.block_read(step, select_mux=True)
+                slots += step["slots"]
+        FTDI_LOCK.release()
+        DATA_LOCK.acquire()
+        self.store_samples(slots, t_stop)
+        DATA_LOCK.release()
+
+    def scan_accumulators(self, store=True):
+        """reads the accumulators of all the PACs, adding the energy measured since the previous scan"""
+        for step in self.scan_plan:
+            FTDI_LOCK.acquire()
+            voltage, current, energy, duration = self.refresh_acc_read(step)
+            FTDI_LOCK.release()
+            t_stop = time.time()
+            if not store:
+                continue
+            # the average current is stored as the VSENSE code giving it
+            self.scan_vbus[step["slots"]] = np.rint(
+                np.array(voltage) / data_buffer.PAC1934_VBUS_LSB
+            )
+            self.scan_vsense[step["slots"]] = data_buffer.vsense_to_codes(
+                np.array(current), self.params["bipolar"]
+            )
+            DATA_LOCK.acquire()
+            self.store_samples(step["slots"], t_stop)
+            for slot, rsense, rail_energy in zip(
+                step["slots"], step["rsense"].tolist(), energy
+            ):
+                name = self.samples.names[slot]
+                total = self.energy.setdefault(name, [0, 0])
+                total[0] += rail_energy / rsense
+                total[1] += duration
+            DATA_LOCK.release()
 
     def process_temperature(self):
         global T_START
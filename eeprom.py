@@ -41,6 +41,8 @@ if common_func.OS == "Linux":
     from pyftdi import ftdi
 elif common_func.OS == "Windows":
     import ftd2xx as ftdi
+elif common_func.OS == "Sim":
+    ftdi = common_func.sim_backend
 
 
 class FTDIEeprom:
@@ -81,6 +83,9 @@ class FTDIEeprom:
                 self.type = 0
             device.close()
             return self.type, dev
+        elif common_func.OS == "Sim":
+            self.type = 1 if dev["eeprom"] == "i2c" else 0
+            return self.type, dev
 
     def init_system(self, desc, ind):
         if self.type == 1:  # i2c mode
@@ -88,7 +93,7 @@ class FTDIEeprom:
             common_func.ftdic_setbitmode(self.device, 0x0, 0x00)
             common_func.ftdic_setbitmode(self.device, 0x0, 0x02)
         else:  # serial mode
-            if common_func.OS == "Windows":
+            if common_func.OS == "Windows" or common_func.OS == "Sim":
                 self.device = common_func.ftdi_open(ind, 0, desc)
             elif common_func.OS == "Linux":
                 self.device = ftdi.Ftdi()
@@ -116,6 +121,8 @@ class FTDIEeprom:
                 else:
                     pass
             return dev
+        elif common_func.OS == "Sim":
+            return ftdi.list_devices()
 
     def collect_eeprom_info(self):
         with open(self.args.file, "r") as file:
@@ -150,7 +157,7 @@ class FTDIEeprom:
     def read_eeprom_board_id_rev(self, pins=None):
         board_id_index = 1
         if self.type == 0:
-            if common_func.OS == "Linux":
+            if common_func.OS == "Linux" or common_func.OS == "Sim":
                 out = self.device.read_eeprom(addr=0x1A, length=3)
                 soc = hex(((out[0] & 0xFC) >> 2) | ((out[1] - 1) << 6))
                 rev = (
@@ -249,7 +256,7 @@ class FTDIEeprom:
                 print("ABORTED.")
 
     def read_eeprom_serial(self):
-        if common_func.OS == "Linux":
+        if common_func.OS == "Linux" or common_func.OS == "Sim":
             ret_data = self.device.read_eeprom(addr=0x1A, length=10)
         elif common_func.OS == "Windows":
             ret_data = self.device.eeUARead(10)
@@ -341,7 +348,7 @@ class FTDIEeprom:
                 infos.append(data2)
             else:
                 infos.append(info[1])
-        if common_func.OS == "Linux":
+        if common_func.OS == "Linux" or common_func.OS == "Sim":
             self.device.write_eeprom(int("0x1a", 16), infos, dry_run=False)
         elif common_func.OS == "Windows":
             self.device.eeUAWrite(bytes(infos))
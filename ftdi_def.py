@@ -41,6 +41,7 @@ MPSSE_CMD_DISABLE_CLOCK_DIVIDE_BY_5 = 0x8A
 MPSSE_CMD_DISABLE_ADAPTIVE_CLOCKING = 0x97
 MPSSE_CMD_SET_CLOCK_DIVISOR = 0x86
 MPSEE_CMD_DISABLE_LOOPBACK = 0x85
+MPSSE_CMD_CLOCK_N_BYTES_NO_DATA = 0x8F
 
 # MPSSE Data Commands - bit mode - MSB first
 MPSSE_CMD_DATA_OUT_BITS_POS_EDGE = 0x12
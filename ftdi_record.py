@@ -0,0 +1,214 @@
+# Copyright 2020-2022 NXP
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# Neither the name of the NXP Semiconductors nor the names of its
+# contributors may be used to endorse or promote products derived from this
+# software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""records the FTDI traffic in a binary log and replays it in place of a connected board"""
+
+import argparse
+import atexit
+import json
+import logging
+import os
+import statistics
+import struct
+import threading
+import time
+
+import ftdi_sim
+import program_config
+
+# log layout: MAGIC, header length (uint16) and JSON header, then the records
+MAGIC = b"PMTFTDI1"
+RECORD = struct.Struct("<BBddH")  # type, FTDI channel, time, duration, payload length
+RECORD_WRITE = 0
+RECORD_READ = 1
+
+
+class Recorder:
+    """writes the bytes exchanged with the FTDI devices and their timing to a log"""
+
+    def __init__(self, path, board_name):
+        self.lock = threading.Lock()
+        self.t_start = time.time()
+        self.file = open(path, "wb")
+        header = json.dumps({"board": board_name, "start": self.t_start}).encode()
+        self.file.write(MAGIC + struct.pack("<H", len(header)) + header)
+        atexit.register(self.close)
+
+    def wrap(self, device, channel):
+        return RecordingDevice(device, channel, self)
+
+    def record(self, record_type, channel, t, duration, payload):
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(
+                RECORD.pack(
+                    record_type, channel, t - self.t_start, duration, len(payload)
+                )
+                + payload
+            )
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class RecordingDevice:
+    """FTDI device proxy recording the written and read bytes"""
+
+    def __init__(self, device, channel, recorder):
+        self.device = device
+        self.channel = channel
+        self.recorder = recorder
+
+    def write(self, buf):
+        self.recorder.record(RECORD_WRITE, self.channel, time.time(), 0, bytes(buf))
+        return self.device.write(buf)
+
+    def read(self, length):
+        t = time.time()
+        data = self.device.read(length)
+        self.recorder.record(RECORD_READ, self.channel, t, time.time() - t, bytes(data))
+        return data
+
+    def getBitMode(self):
+        t = time.time()
+        value = self.device.getBitMode()
+        self.recorder.record(
+            RECORD_READ, self.channel, t, time.time() - t, bytes([value])
+        )
+        return value
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+
+def load(path):
+    """returns the header and the records (type, channel, time, duration, payload) of a log"""
+    with open(path, "rb") as file:
+        data = file.read()
+    if data[: len(MAGIC)] != MAGIC:
+        raise ValueError(path + " is not a FTDI record file")
+    pos = len(MAGIC)
+    (length,) = struct.unpack_from("<H", data, pos)
+    pos += 2
+    header = json.loads(data[pos : pos + length])
+    pos += length
+    records = []
+    while pos + RECORD.size <= len(data):
+        record_type, channel, t, duration, length = RECORD.unpack_from(data, pos)
+        pos += RECORD.size
+        records.append((record_type, channel, t, duration, data[pos : pos + length]))
+        pos += length
+    return header, records
+
+
+class Replay:
+    """responses of a recorded log, split per FTDI channel"""
+
+    def __init__(self, path):
+        self.header, records = load(path)
+        self.streams = {}
+        durations = []
+        for record_type, channel, __, duration, payload in records:
+            if record_type == RECORD_READ and payload:
+                self.streams.setdefault(channel, bytearray()).extend(payload)
+                durations.append(duration)
+        # a fixed round trip time makes the benchmarks reproducible
+        self.latency = statistics.median(durations) if durations else 0
+        self.eeprom = ftdi_sim.eeprom_content(self.header["board"], 0, 1)
+
+
+class ReplayDevice:
+    """FTDI device answering with the recorded bytes of its channel, written bytes are dropped"""
+
+    def __init__(self, replay, channel):
+        self.replay = replay
+        self.stream = replay.streams.setdefault(channel, bytearray())
+        self.round_trip = False
+        self.exhausted = False
+
+    def set_bitmode(self, out_pins, mode):
+        pass
+
+    def write(self, buf):
+        self.round_trip = True
+        return len(buf)
+
+    def read(self, length):
+        if self.round_trip:
+            self.round_trip = False
+            time.sleep(self.replay.latency)
+        if not self.stream and not self.exhausted:
+            self.exhausted = True
+            logging.warning("End of the FTDI replay log reached")
+        out = bytes(self.stream[:length])
+        del self.stream[:length]
+        return out
+
+    def close(self):
+        pass
+
+    def read_eeprom(self, addr, length):
+        return bytes(self.replay.eeprom[addr : addr + length])
+
+    def write_eeprom(self, addr, data, dry_run=True):
+        pass
+
+
+REPLAY = None
+
+
+def get_replay():
+    global REPLAY
+    if REPLAY is None:
+        REPLAY = Replay(
+            os.environ.get("PMT_FTDI_REPLAY_FILE", program_config.FTDI_REPLAY_FILE)
+        )
+    return REPLAY
+
+
+def list_devices():
+    """returns the recorded board, identified through a serial EEPROM"""
+    return [{"index": 0, "board": get_replay().header["board"], "eeprom": "serial"}]
+
+
+def open_device(index, channel):
+    return ReplayDevice(get_replay(), channel)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PMT acquisition benchmark on a log")
+    parser.add_argument("file", help="FTDI record file to replay")
+    parser.add_argument("-t", "--time", type=float, default=5, help="duration in sec")
+    args = parser.parse_args()
+    os.environ["PMT_FTDI_BACKEND"] = "replay"
+    os.environ["PMT_FTDI_REPLAY_FILE"] = args.file
+    ftdi_sim.run_benchmark(None, args.time)
@@ -0,0 +1,629 @@
+# Copyright 2020-2022 NXP
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# Neither the name of the NXP Semiconductors nor the names of its
+# contributors may be used to endorse or promote products derived from this
+# software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""software model of the FT4232H MPSSE engine and of the I2C devices found on the boards"""
+
+import argparse
+import importlib
+import math
+import os
+import random
+import threading
+import time
+
+import eeprom_mapping_table
+import ftdi_def as ft_def
+import program_config
+from board_configuration import common
+
+# with 3-phase clocking, each I2C bit lasts 1.5 period of the MPSSE clock
+BIT_TIME = 1.5 / (60000000 / ((1 + ft_def.CLOCK_DIVISOR_400K) * 2))
+MPSSE_CMD_SIZE = {
+    ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE: 3,
+    ft_def.MPSSE_CMD_SET_DATA_BITS_HIGHBYTE: 3,
+    ft_def.MPSSE_CMD_SET_CLOCK_DIVISOR: 3,
+    ft_def.MPSSE_CMD_CLOCK_N_BYTES_NO_DATA: 3,
+    ft_def.MPSSE_CMD_DATA_OUT_BITS_POS_EDGE: 3,
+    ft_def.MPSSE_CMD_DATA_OUT_BITS_NEG_EDGE: 3,
+    ft_def.MPSSE_CMD_DATA_IN_BITS_POS_EDGE: 2,
+    ft_def.MPSSE_CMD_DATA_IN_BITS_NEG_EDGE: 2,
+}
+PAC1934_CONVERSION_TIME = 0.001
+PAC1934_SAMPLE_RATES = [1024, 256, 64, 8]
+BOARDS = []
+
+
+def rail_load(rail_name, t):
+    """returns the voltage (V) and current (mA) of the rail at time t"""
+    load = program_config.SIM_LOADS.get(rail_name, program_config.SIM_LOADS["default"])
+    current = load.get("current", 0)
+    amplitude = load.get("amplitude", 0)
+    period = load.get("period", 1)
+    shape = load.get("shape", "dc")
+    if shape == "sine":
+        current += amplitude * math.sin(2 * math.pi * t / period)
+    elif shape == "square":
+        current += amplitude if (t % period) < period / 2 else -amplitude
+    elif shape == "noise":
+        current += random.uniform(-amplitude, amplitude)
+    return load.get("voltage", 0), current
+
+
+def clip(value, low, high):
+    return max(low, min(high, int(round(value))))
+
+
+class RegisterDevice:
+    """I2C device with a register pointer set by the first written byte and auto-incremented"""
+
+    def __init__(self, default=0x00, size=256):
+        self.regs = bytearray([default] * size)
+        self.pointer = 0
+        self.first = True
+
+    def start(self, read, t):
+        self.first = not read
+
+    def write(self, data, t):
+        if self.first:
+            self.pointer = data % len(self.regs)
+            self.first = False
+        else:
+            self.regs[self.pointer] = data
+            self.pointer = (self.pointer + 1) % len(self.regs)
+        return True
+
+    def read(self, t):
+        data = self.regs[self.pointer]
+        self.pointer = (self.pointer + 1) % len(self.regs)
+        return data
+
+
+class At24(RegisterDevice):
+    """AT24 EEPROM with a 1 or 2 bytes memory address"""
+
+    def __init__(self, content, address_bytes):
+        super().__init__()
+        self.regs = content
+        self.address_bytes = address_bytes
+        self.address_left = 0
+
+    def start(self, read, t):
+        if not read:
+            self.address_left = self.address_bytes
+            self.pointer = 0
+
+    def write(self, data, t):
+        if self.address_left:
+            self.pointer = ((self.pointer << 8) | data) % len(self.regs)
+            self.address_left -= 1
+        else:
+            self.regs[self.pointer] = data
+            self.pointer = (self.pointer + 1) % len(self.regs)
+        return True
+
+
+class Pca9548:
+    """PCA9548 I2C mux, the control byte enables its downstream channels"""
+
+    def __init__(self):
+        self.control = 0x00
+
+    def start(self, read, t):
+        pass
+
+    def write(self, data, t):
+        self.control = data
+        return True
+
+    def read(self, t):
+        return self.control
+
+
+class TemperatureSensor:
+    """LM75 like sensor, reading returns the temperature register"""
+
+    def __init__(self, temperature=25.0):
+        self.value = (int(temperature / 0.125) << 5).to_bytes(2, "big")
+        self.pos = 0
+
+    def start(self, read, t):
+        self.pos = 0
+
+    def write(self, data, t):
+        return True
+
+    def read(self, t):
+        data = self.value[self.pos % 2]
+        self.pos += 1
+        return data
+
+
+class Pac1934:
+    """PAC1934 power monitor with REFRESH commands, accumulators, averages and block reads"""
+
+    def __init__(self):
+        self.channels = [None] * 4  # (rail name, rsense) measured by each channel
+        self.pointer = 0
+        self.first = True
+        self.stream = b""
+        self.pos = 0
+        self.ctrl = 0x00
+        self.neg_pwr = 0x00
+        self.ctrl_act = 0x00
+        self.neg_pwr_act = 0x00
+        self.acc = [0] * 4
+        self.acc_count = 0
+        self.acc_time = time.time()
+        self.history = []
+        self.regs = {
+            "acc_count": 0,
+            "acc": [0] * 4,
+            "vbus": [0] * 4,
+            "vsense": [0] * 4,
+            "vbus_avg": [0] * 4,
+            "vsense_avg": [0] * 4,
+            "vpower": [0] * 4,
+        }
+        self.pending = None
+
+    def sample(self, t):
+        """returns the signed VBUS, VSENSE and VPOWER codes of the 4 channels at time t"""
+        vbus, vsense, vpower = [0] * 4, [0] * 4, [0] * 4
+        for ch, channel in enumerate(self.channels):
+            if channel is None:
+                continue
+            voltage, current = rail_load(channel[0], t)
+            vsense_volt = current * channel[1] / 1000000
+            vbus[ch] = clip(voltage / 32 * 65535, 0, 65535)
+            if self.neg_pwr_act & (0x80 >> ch):  # bidirectional VSENSE
+                vsense[ch] = clip(vsense_volt / 0.1 * 32768, -32768, 32767)
+            else:
+                vsense[ch] = clip(vsense_volt / 0.1 * 65535, 0, 65535)
+            vpower[ch] = (vbus[ch] * vsense[ch]) >> 4
+        return vbus, vsense, vpower
+
+    def accumulate(self, t):
+        """adds the conversions done since the last call to the accumulators"""
+        rate = PAC1934_SAMPLE_RATES[self.ctrl_act >> 6]
+        if self.ctrl_act & 0x20:  # SLEEP
+            count = 0
+            self.acc_time = t
+        elif self.ctrl_act & 0x10:  # SING, one conversion per REFRESH
+            count = 1
+            self.acc_time = t
+        else:
+            count = int((t - self.acc_time) * rate)
+            self.acc_time += count / rate
+        if count:
+            __, __, vpower = self.sample(t)
+            for ch in range(4):
+                self.acc[ch] += count * vpower[ch]
+            self.acc_count += count
+
+    def refresh(self, t, reset):
+        """latches the measurements, readable once the conversion is done"""
+        self.accumulate(t)
+        self.ctrl_act = self.ctrl
+        self.neg_pwr_act = self.neg_pwr
+        vbus, vsense, vpower = self.sample(t)
+        self.history = (self.history + [(vbus, vsense)])[-8:]
+        regs = {
+            "acc_count": self.acc_count,
+            "acc": list(self.acc),
+            "vbus": vbus,
+            "vsense": vsense,
+            "vbus_avg": [
+                sum(h[0][ch] for h in self.history) // len(self.history)
+                for ch in range(4)
+            ],
+            "vsense_avg": [
+                int(sum(h[1][ch] for h in self.history) / len(self.history))
+                for ch in range(4)
+            ],
+            "vpower": vpower,
+        }
+        if reset:
+            self.acc = [0] * 4
+            self.acc_count = 0
+        self.pending = (t + PAC1934_CONVERSION_TIME, regs)
+
+    def update(self, t):
+        if self.pending and t >= self.pending[0]:
+            self.regs = self.pending[1]
+            self.pending = None
+
+    def register_bytes(self, reg):
+        """returns the content of the register, as read on the bus"""
+        if reg == 0x01:
+            return bytes([self.ctrl])
+        if reg == 0x02:
+            return (self.regs["acc_count"] & 0xFFFFFF).to_bytes(3, "big")
+        if 0x03 <= reg <= 0x06:
+            acc = self.regs["acc"][reg - 0x03]
+            return (acc & 0xFFFFFFFFFFFF).to_bytes(6, "big")
+        for base, name in ((0x07, "vbus"), (0x0B, "vsense")):
+            if base <= reg < base + 4:
+                return (self.regs[name][reg - base] & 0xFFFF).to_bytes(2, "big")
+        for base, name in ((0x0F, "vbus_avg"), (0x13, "vsense_avg")):
+            if base <= reg < base + 4:
+                return (self.regs[name][reg - base] & 0xFFFF).to_bytes(2, "big")
+        if 0x17 <= reg <= 0x1A:
+            vpower = self.regs["vpower"][reg - 0x17] << 4
+            return (vpower & 0xFFFFFFFF).to_bytes(4, "big")
+        registers = {
+            0x1B: 0x00,
+            0x1C: 0x00,
+            0x1D: self.neg_pwr,
+            0x20: 0x00,
+            0x21: self.ctrl_act,
+            0x22: 0x00,
+            0x23: self.neg_pwr_act,
+            0x24: self.ctrl_act,
+            0x25: 0x00,
+            0x26: self.neg_pwr_act,
+            0xFD: 0x5B,  # PRODUCT_ID
+            0xFE: 0x5D,  # MANUFACTURER_ID
+            0xFF: 0x03,  # REVISION_ID
+        }
+        if reg in registers:
+            return bytes([registers[reg]])
+        return b""
+
+    def start(self, read, t):
+        self.update(t)
+        if read:
+            self.stream = b"".join(
+                self.register_bytes(reg) for reg in range(self.pointer, 0x100)
+            )
+            self.pos = 0
+        else:
+            self.first = True
+
+    def write(self, data, t):
+        if self.first:
+            self.first = False
+            self.pointer = data
+            if data == 0x00 or data == 0x1E:  # REFRESH
+                self.refresh(t, True)
+            elif data == 0x1F:  # REFRESH_V, accumulators are kept
+                self.refresh(t, False)
+            return True
+        if self.pointer == 0x01:
+            self.ctrl = data
+        elif self.pointer == 0x1D:
+            self.neg_pwr = data
+        self.pointer += 1
+        return True
+
+    def read(self, t):
+        if self.pos >= len(self.stream):
+            return 0xFF
+        data = self.stream[self.pos]
+        self.pos += 1
+        return data
+
+    def general_call(self, data, t):
+        if data == 0x1E:  # REFRESH_G
+            self.refresh(t, True)
+
+
+class GeneralCall:
+    """I2C general call address, the written bytes are broadcast to the visible devices"""
+
+    def __init__(self, board):
+        self.board = board
+
+    def start(self, read, t):
+        pass
+
+    def write(self, data, t):
+        for device in self.board.visible_devices():
+            if hasattr(device, "general_call"):
+                device.general_call(data, t)
+        return True
+
+    def read(self, t):
+        return 0xFF
+
+
+def eeprom_content(name, rails_number, serial_number):
+    """returns the EEPROM image identifying the board, as flashed by the EEPROM programmer tool"""
+    base = max(
+        (b for b in common.board_eeprom_names.values() if name.startswith(b)), key=len
+    )
+    board_name = next(k for k, v in common.board_eeprom_names.items() if v == base)
+    board_id = int(
+        next(
+            code
+            for code, item in eeprom_mapping_table.INFOS[1]["datas"].items()
+            if item == board_name
+        ),
+        16,
+    )
+    rev = name[len(base) :].upper() or "A0"
+    content = bytearray([0xFF] * 256)
+    content[0x1A : 0x1A + 10] = bytes(
+        [
+            ((board_id << 2) | 0x01) & 0xFF,
+            ((board_id << 2) >> 8) + 1,
+            ((ord(rev[0]) - ord("A") + 1) << 4) + int(rev[1]) + 1,
+            0x7F,
+            0x7F,
+            0x7F,
+            0x7F,
+            rails_number + 1,
+            (serial_number & 0xFF) + 1,
+            (serial_number >> 8) + 1,
+        ]
+    )
+    return content
+
+
+class SimBoard:
+    """devices of one simulated board, built from its configuration file"""
+
+    def __init__(self, name, index):
+        self.name = name
+        self.lock = threading.Lock()
+        self.gpio = [0x00] * 4  # pins of the FTDI channels in bitbang mode
+        self.muxes = {}
+        self.devices = {}  # address -> list of (mux channel, device)
+        board_c = importlib.import_module("board_configuration." + name)
+        for rail in board_c.mapping_power:
+            pac = rail["pac"]
+            self.get_device(rail, pac[1], Pac1934).channels[pac[0] - 1] = (
+                rail["name"],
+                rail["rsense"][0],
+            )
+            if len(pac) >= 4:  # low current shunt measured by another channel
+                alt_addr = pac[4] if len(pac) >= 6 else pac[1]
+                self.get_device(rail, alt_addr, Pac1934).channels[pac[3] - 1] = (
+                    rail["name"],
+                    rail["rsense"][1],
+                )
+        for gpio in board_c.mapping_gpio_i2c:
+            if gpio.get("pca6416"):
+                self.get_device(gpio, gpio["pca6416"][0], lambda: RegisterDevice(0xFF))
+            else:  # adp5585
+                self.get_device(gpio, gpio["adp5585"][0], RegisterDevice)
+        sensor = getattr(board_c, "temperature_sensor", None)
+        if sensor:
+            self.get_device(sensor, sensor["sensor"][0], TemperatureSensor)
+        self.eeprom = eeprom_content(name, len(board_c.mapping_power), index + 1)
+        self.eeprom_type = "serial"
+        for pins in common.board_eeprom_i2c:
+            if pins["board_name"] == name:
+                at24 = pins["at24cxx"]
+                self.get_device(
+                    pins, at24["addr"], lambda: At24(self.eeprom, at24["type"] + 1)
+                )
+                self.eeprom_type = "i2c"
+
+    def get_device(self, pins, addr, factory):
+        """returns the device at addr behind the mux of pins, created if needed"""
+        mux = tuple(pins["pca9548"]) if pins.get("pca9548") else None
+        if mux and mux[1] not in self.muxes:
+            self.muxes[mux[1]] = Pca9548()
+            self.devices.setdefault(mux[1], []).append((None, self.muxes[mux[1]]))
+        for dev_mux, device in self.devices.get(addr, []):
+            if dev_mux == mux:
+                return device
+        device = factory()
+        self.devices.setdefault(addr, []).append((mux, device))
+        return device
+
+    def is_visible(self, mux):
+        return mux is None or bool(self.muxes[mux[1]].control & (1 << mux[0]))
+
+    def find(self, addr):
+        for mux, device in self.devices.get(addr, []):
+            if self.is_visible(mux):
+                return device
+        return None
+
+    def visible_devices(self):
+        return [
+            device
+            for devices in self.devices.values()
+            for mux, device in devices
+            if self.is_visible(mux)
+        ]
+
+
+class SimDevice:
+    """simulated FT4232H channel, used in place of a pylibftdi / ftd2xx device"""
+
+    def __init__(self, board, channel):
+        self.board = board
+        self.channel = channel
+        self.bitmode = 0x00
+        self.rx = bytearray()
+        self.cmd = b""  # incomplete MPSSE command, completed by the next write
+        self.scl = 1
+        self.sda = 1
+        self.state = None  # None, "address", "write" or "read"
+        self.target = None
+        self.acked = False
+        self.bus_time = 0
+        self.round_trip = False
+
+    def set_bitmode(self, out_pins, mode):
+        self.bitmode = mode
+        self.cmd = b""
+        self.rx.clear()
+
+    def write(self, buf):
+        with self.board.lock:
+            if self.bitmode == 0x01:  # bitbang
+                self.board.gpio[self.channel] = buf[-1]
+            elif self.bitmode == 0x02:  # MPSSE
+                self.mpsse(bytes(buf))
+        return len(buf)
+
+    def read(self, length):
+        if self.bitmode == 0x01:
+            return bytes([self.board.gpio[self.channel]])
+        if self.round_trip:
+            self.round_trip = False
+            time.sleep(program_config.SIM_USB_LATENCY)
+        with self.board.lock:
+            out = bytes(self.rx[:length])
+            del self.rx[:length]
+        return out
+
+    def close(self):
+        self.rx.clear()
+
+    def read_eeprom(self, addr, length):
+        return bytes(self.board.eeprom[addr : addr + length])
+
+    def write_eeprom(self, addr, data, dry_run=True):
+        if not dry_run:
+            self.board.eeprom[addr : addr + len(data)] = bytes(data)
+
+    def mpsse(self, data):
+        """decodes the MPSSE commands and plays them on the I2C bus"""
+        data = self.cmd + data
+        t = max(time.time(), self.bus_time)
+        i = 0
+        while i < len(data):
+            op = data[i]
+            size = MPSSE_CMD_SIZE.get(op, 1)
+            if i + size > len(data):
+                break
+            if op == ft_def.MPSSE_CMD_SET_DATA_BITS_LOWBYTE:
+                self.set_lines(data[i + 1], data[i + 2], t)
+            elif op == ft_def.MPSSE_CMD_GET_DATA_BITS_LOWBYTE:
+                self.rx.append(self.scl | (self.sda << 1))
+            elif op == ft_def.MPSSE_CMD_DATA_OUT_BITS_NEG_EDGE:
+                t += (data[i + 1] + 1) * BIT_TIME
+                if data[i + 1] == ft_def.DATA_SIZE_8BITS:
+                    self.acked = self.i2c_write(data[i + 2], t)
+            elif op == ft_def.MPSSE_CMD_DATA_IN_BITS_POS_EDGE:
+                t += (data[i + 1] + 1) * BIT_TIME
+                if data[i + 1] == ft_def.DATA_SIZE_8BITS:
+                    self.rx.append(self.i2c_read(t))
+                else:  # ACK bit of the last written byte
+                    self.rx.append(0x00 if self.acked else 0x01)
+            elif op == ft_def.MPSSE_CMD_CLOCK_N_BYTES_NO_DATA:
+                t += ((data[i + 1] | (data[i + 2] << 8)) + 1) * 8 * BIT_TIME
+            i += size
+        self.cmd = data[i:]
+        self.bus_time = t
+        if self.rx:
+            self.round_trip = True
+
+    def set_lines(self, value, direction, t):
+        """updates SCL / SDA and detects START and STOP conditions"""
+        scl = value & 0x01 if direction & 0x01 else 1
+        sda = (value >> 1) & 0x01 if direction & 0x02 else 1
+        if self.scl and scl:
+            if self.sda and not sda:
+                self.state = "address"
+                self.target = None
+            elif not self.sda and sda:
+                self.state = None
+                self.target = None
+        self.scl = scl
+        self.sda = sda
+
+    def i2c_write(self, data, t):
+        if self.state == "address":
+            addr = data >> 1
+            read = data & 0x01
+            if addr == 0x00 and not read:
+                self.target = GeneralCall(self.board)
+            else:
+                self.target = self.board.find(addr)
+            if self.target is None:
+                self.state = None
+                return False
+            self.target.start(read, t)
+            self.state = "read" if read else "write"
+            return True
+        if self.state == "write":
+            return self.target.write(data, t)
+        return False
+
+    def i2c_read(self, t):
+        if self.state == "read":
+            return self.target.read(t)
+        return 0xFF
+
+
+def get_boards():
+    if not BOARDS:
+        for index, name in enumerate(program_config.SIM_BOARDS):
+            BOARDS.append(SimBoard(name, index))
+    return BOARDS
+
+
+def list_devices():
+    """returns the simulated boards, as listed by the FTDI enumeration"""
+    return [
+        {"index": index, "board": board.name, "eeprom": board.eeprom_type}
+        for index, board in enumerate(get_boards())
+    ]
+
+
+def open_device(index, channel):
+    return SimDevice(get_boards()[index], channel)
+
+
+def run_benchmark(board_name, duration):
+    """runs the acquisition loop for duration sec and prints the sample rate of each rail"""
+    import common_function as common_func
+    import drv_ftdi
+
+    board = drv_ftdi.Board(
+        argparse.Namespace(command="monitor", board=board_name, id=-1, load=None)
+    )
+    thread_process = threading.Thread(target=board.get_data)
+    thread_process.start()
+    time.sleep(duration)
+    drv_ftdi.FLAG_UI_STOP = True
+    thread_process.join()
+    total = 0
+    for name, samples in zip(board.samples.names, board.samples.count.tolist()):
+        total += samples
+        print(name + ": " + str(round(samples / duration, 1)) + " SPS")
+    print("Total: " + str(round(total / duration, 1)) + " SPS")
+    print("FTDI reads: " + str(common_func.FTDI_READ_STATS))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PMT acquisition benchmark")
+    parser.add_argument("board", help="board configuration to simulate")
+    parser.add_argument("-t", "--time", type=float, default=5, help="duration in sec")
+    args = parser.parse_args()
+    os.environ["PMT_FTDI_BACKEND"] = "sim"
+    program_config.SIM_BOARDS = [args.board]
+    run_benchmark(args.board, args.time)
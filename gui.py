@@ -32,14 +32,16 @@ import signal
 import os
 import time
 import copy
-import csv
-import pickle
 
 import pyqtgraph as pg
 from pyqtgraph.Qt import QtGui, QtCore, QtWidgets
 import numpy as np
 
+import capture_file
+import csv_export
+import data_buffer
 import drv_ftdi
+import program_config
 
 PROGRAM_VERSION = "PMT v2.5.3"
 COPYRIGHT_INFO = "Copyright 2020-2023 NXP"
@@ -144,66 +146,10 @@ class ProcessData(QtCore.QThread):
         self.parent = parent
 
     def run(self):
-        remote_buf = []
         drv_ftdi.DATA_LOCK.acquire()
-        for remote_rail in self.parent.b.data_buf:
-            remote_buf.append(copy.deepcopy(remote_rail))
-            remote_rail["current"] = [[0, 0]]
-            remote_rail["voltage"] = [[0, 0]]
+        new_samples = self.parent.b.samples.fetch(self.parent.samples_cursor)
         drv_ftdi.DATA_LOCK.release()
-        for rail in remote_buf:
-            local_rail = next(
-                (
-                    item
-                    for item in self.parent.rail_buf
-                    if item["railnumber"] == rail["railnumber"]
-                ),
-                None,
-            )
-            if len(rail["voltage"]) > 1:
-                rail["voltage"].pop(0)
-                rail["current"].pop(0)
-            local_rail["voltage"] = np.append(
-                local_rail["voltage"],
-                np.array(rail["voltage"], dtype=np.float16),
-                axis=0,
-            )
-            local_rail["current"] = np.append(
-                local_rail["current"],
-                np.array(rail["current"], dtype=np.float16),
-                axis=0,
-            )
-
-        self.parent.groups_buf = []
-        for i, group in enumerate(self.parent.b.power_groups):
-            self.parent.groups_buf.append(
-                {
-                    "group_name": group["name"],
-                    "power": np.array([[0, 0]], dtype=np.float16),
-                }
-            )
-            power_group = np.array([[0, 0]], dtype=np.float16)
-            for rail_group in group["rails"]:
-                rail = next(
-                    (
-                        item
-                        for item in self.parent.rail_buf
-                        if item["railnumber"] == rail_group
-                    ),
-                    None,
-                )
-                if rail is None:
-                    return
-                power_rail = np.empty_like(rail["voltage"][1:])
-                power_rail[:, 0] = rail["voltage"][1:, 0]
-                power_rail[:, 1] = rail["voltage"][1:, 1] * rail["current"][1:, 1]
-                if power_group.shape[0] > power_rail.shape[0]:
-                    power_group.resize(power_rail.shape)
-                elif power_rail.shape[0] - power_group.shape[0] <= 2:
-                    power_rail.resize(power_group.shape)
-                power_group = power_group + power_rail
-            power_group[:, 0] = power_rail[:, 0]
-            self.parent.groups_buf[i]["power"] = power_group
+        self.parent.new_samples.append(new_samples)
 
         if self.parent.b.temperature_sensor:
             drv_ftdi.TEMP_DATA_LOCK.acquire()
@@ -214,6 +160,41 @@ class ProcessData(QtCore.QThread):
         self.sig_update_gui.emit()
 
 
+class ExportData(QtCore.QThread):
+    """writes an export of the capture snapshots in background, with write(path, *args, progress=...)"""
+
+    sig_progress = QtCore.pyqtSignal(int)
+
+    def __init__(self, parent, write, path, *args):
+        QtCore.QThread.__init__(self, parent)
+        self.write = write
+        self.path = path
+        self.args = args
+        self.cancelled = False
+        self.done = False
+
+    def progress(self, fraction):
+        """reports the progress in %, returns False once the export is cancelled"""
+        self.sig_progress.emit(int(100 * fraction))
+        return not self.cancelled
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            self.done = self.write(self.path, *self.args, progress=self.progress)
+        except Exception as error:
+            print(error)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def write_png(path, image, progress=None):
+    """saves the QImage image as png picture"""
+    return image.save(path, "png")
+
+
 class Worker(QtCore.QObject):
     """creates worker class for thread"""
 
@@ -254,6 +235,7 @@ class ZoomDataWin(QtGui.QDialog):
             "I_avg",
             "I_min",
             "I_max",
+            "E (mJ)",
         ]
         self.data_table = QtGui.QTableWidget(0, len(self.header_title))
         self.data_table.setHorizontalHeaderLabels(self.header_title)
@@ -286,60 +268,38 @@ class ZoomDataWin(QtGui.QDialog):
             self.rail_control.setText("Time : " + str(maxx - minx) + " sec")
             i = 0
             for d_rail in self.parent.b.rails_to_display:
-                rail = next(
-                    (
-                        item
-                        for item in self.parent.rail_buf
-                        if item["railnumber"] == d_rail["name"]
-                    ),
-                    None,
-                )
-                voltage = rail["voltage"][1:]
-                current = rail["current"][1:]
-                power = np.empty_like(voltage)
-                power[:, 0] = voltage[:, 0]
-                power[:, 1] = voltage[:, 1] * current[:, 1]
-
-                min_t_p = power[:, 0].searchsorted(minx)
-                max_t_p = power[:, 0].searchsorted(maxx)
-                if min_t_p and min_t_p != max_t_p:
-                    p_avg = power[min_t_p:max_t_p, 1].mean()
-                    p_min = power[min_t_p:max_t_p, 1].min()
-                    p_max = power[min_t_p:max_t_p, 1].max()
+                index = self.parent.rails_index[d_rail["name"]]
+                start, stop = index["time"].view().searchsorted((minx, maxx))
+                if start and start != stop:
+                    plots = self.parent.rails_plot[d_rail["name"]]
+                    p_avg = index["power"].mean(start, stop)
+                    p_min, p_max = plots["power"].extrema(start, stop)
+                    v_avg = index["voltage"].mean(start, stop)
+                    v_min, v_max = plots["voltage"].extrema(start, stop)
+                    c_avg = index["current"].mean(start, stop)
+                    c_min, c_max = plots["current"].extrema(start, stop)
+                    energy = index["power"].integral(start, stop)
                     self.data_table.setItem(i, 1, QtGui.QTableWidgetItem(str(p_avg)))
                     self.data_table.setItem(i, 2, QtGui.QTableWidgetItem(str(p_min)))
                     self.data_table.setItem(i, 3, QtGui.QTableWidgetItem(str(p_max)))
-
-                min_t_v = voltage[:, 0].searchsorted(minx)
-                max_t_v = voltage[:, 0].searchsorted(maxx)
-                if min_t_v and min_t_v != max_t_v:
-                    v_avg = voltage[min_t_v:max_t_v, 1].mean()
-                    v_min = voltage[min_t_v:max_t_v, 1].min()
-                    v_max = voltage[min_t_v:max_t_v, 1].max()
                     self.data_table.setItem(i, 4, QtGui.QTableWidgetItem(str(v_avg)))
                     self.data_table.setItem(i, 5, QtGui.QTableWidgetItem(str(v_min)))
                     self.data_table.setItem(i, 6, QtGui.QTableWidgetItem(str(v_max)))
-
-                min_t_c = current[:, 0].searchsorted(minx)
-                max_t_c = current[:, 0].searchsorted(maxx)
-                if min_t_c and min_t_c != max_t_c:
-                    c_avg = current[min_t_c:max_t_c, 1].mean()
-                    c_min = current[min_t_c:max_t_c, 1].min()
-                    c_max = current[min_t_c:max_t_c, 1].max()
                     self.data_table.setItem(i, 7, QtGui.QTableWidgetItem(str(c_avg)))
                     self.data_table.setItem(i, 8, QtGui.QTableWidgetItem(str(c_min)))
                     self.data_table.setItem(i, 9, QtGui.QTableWidgetItem(str(c_max)))
+                    self.data_table.setItem(i, 10, QtGui.QTableWidgetItem(str(energy)))
                 i += 1
 
             for j, group in enumerate(self.parent.groups_buf):
-                time_group = group["power"][:, 0]
-                power = group["power"][:, 1]
-                min_t_gp = time_group.searchsorted(minx)
-                max_t_gp = time_group.searchsorted(maxx)
-                if min_t_gp and min_t_gp != max_t_gp:
-                    gp_avg = power[min_t_gp:max_t_gp].mean()
-                    gp_min = power[min_t_gp:max_t_gp].min()
-                    gp_max = power[min_t_gp:max_t_gp].max()
+                index = self.parent.groups_index[group["group_name"]]
+                start, stop = index["time"].view().searchsorted((minx, maxx))
+                if start and start != stop:
+                    gp_avg = index["power"].mean(start, stop)
+                    gp_min, gp_max = self.parent.groups_plot[
+                        group["group_name"]
+                    ].extrema(start, stop)
+                    energy = index["power"].integral(start, stop)
                     self.data_table.setItem(
                         i + j, 1, QtGui.QTableWidgetItem(str(gp_avg))
                     )
@@ -349,6 +309,9 @@ class ZoomDataWin(QtGui.QDialog):
                     self.data_table.setItem(
                         i + j, 3, QtGui.QTableWidgetItem(str(gp_max))
                     )
+                    self.data_table.setItem(
+                        i + j, 10, QtGui.QTableWidgetItem(str(energy))
+                    )
 
 
 class MPDataWin(QtGui.QDialog):
@@ -389,45 +352,26 @@ class MPDataWin(QtGui.QDialog):
             self.rail_control.setText("Time : " + str(time_coord) + " sec")
             i = 0
             for d_rail in self.parent.b.rails_to_display:
-                rail = next(
-                    (
-                        item
-                        for item in self.parent.rail_buf
-                        if item["railnumber"] == d_rail["name"]
-                    ),
-                    None,
-                )
-                voltage = rail["voltage"][1:]
-                current = rail["current"][1:]
-                power = np.empty_like(voltage)
-                power[:, 0] = voltage[:, 0]
-                power[:, 1] = voltage[:, 1] * current[:, 1]
-                x_coord_p = power[:, 0].searchsorted(time_coord)
-                x_coord_v = voltage[:, 0].searchsorted(time_coord)
-                x_coord_c = current[:, 0].searchsorted(time_coord)
-                if x_coord_p:
-                    mp_power = power[x_coord_p - 1, 1]
-                    self.data_table.setItem(i, 1, QtGui.QTableWidgetItem(str(mp_power)))
-                if x_coord_v:
-                    mp_voltage = voltage[x_coord_v - 1, 1]
-                    self.data_table.setItem(
-                        i, 2, QtGui.QTableWidgetItem(str(mp_voltage))
-                    )
-                if x_coord_c:
-                    mp_current = current[x_coord_c - 1, 1]
-                    self.data_table.setItem(
-                        i, 3, QtGui.QTableWidgetItem(str(mp_current))
-                    )
+                time = self.parent.rails_index[d_rail["name"]]["time"].view()
+                x_coord = time.searchsorted(time_coord)
+                if x_coord:
+                    plots = self.parent.rails_plot[d_rail["name"]]
+                    for column, key in ((1, "power"), (2, "voltage"), (3, "current")):
+                        value = plots[key].values(x_coord - 1, x_coord)[0]
+                        self.data_table.setItem(
+                            i, column, QtGui.QTableWidgetItem(str(value))
+                        )
                 i += 1
 
             for j, group in enumerate(self.parent.groups_buf):
-                time_group = group["power"][1:, 0]
-                power = group["power"][1:, 1]
-                x_coord_gp = time_group.searchsorted(time_coord)
+                time = self.parent.groups_index[group["group_name"]]["time"].view()
+                x_coord_gp = time.searchsorted(time_coord)
                 if x_coord_gp:
-                    mp_gpower = power[x_coord_p - 1]
+                    mp_gpower = self.parent.groups_plot[group["group_name"]].values(
+                        x_coord_gp - 1, x_coord_gp
+                    )[0]
                     self.data_table.setItem(
-                        i + j + 1, 1, QtGui.QTableWidgetItem(str(mp_gpower))
+                        i + j, 1, QtGui.QTableWidgetItem(str(mp_gpower))
                     )
 
     def closeEvent(self, event):
@@ -483,26 +427,19 @@ class GlobalDataWin(QtGui.QDialog):
         if self.isVisible():
             i = 0
             for d_rail in self.parent.b.rails_to_display:
-                rail = next(
-                    (
-                        item
-                        for item in self.parent.rail_buf
-                        if item["railnumber"] == d_rail["name"]
-                    ),
-                    None,
-                )
-                voltage = rail["voltage"][1:, 1]
-                current = rail["current"][1:, 1]
-                power = voltage * current
-                p_avg = power.mean()
-                p_min = power.min()
-                p_max = power.max()
-                v_avg = voltage.mean()
-                v_min = voltage.min()
-                v_max = voltage.max()
-                c_avg = current.mean()
-                c_min = current.min()
-                c_max = current.max()
+                stats = self.parent.rails_stats[d_rail["name"]]
+                if not stats["power"].count:
+                    i += 1
+                    continue
+                p_avg = stats["power"].mean()
+                p_min = stats["power"].minimum
+                p_max = stats["power"].maximum
+                v_avg = stats["voltage"].mean()
+                v_min = stats["voltage"].minimum
+                v_max = stats["voltage"].maximum
+                c_avg = stats["current"].mean()
+                c_min = stats["current"].minimum
+                c_max = stats["current"].maximum
                 self.data_table.setItem(i, 1, QtGui.QTableWidgetItem(str(p_avg)))
                 self.data_table.setItem(i, 2, QtGui.QTableWidgetItem(str(p_min)))
                 self.data_table.setItem(i, 3, QtGui.QTableWidgetItem(str(p_max)))
@@ -515,10 +452,12 @@ class GlobalDataWin(QtGui.QDialog):
                 i += 1
 
             for j, group in enumerate(self.parent.groups_buf):
-                power = group["power"][:, 1]
-                gp_avg = power.mean()
-                gp_min = power.min()
-                gp_max = power.max()
+                stats = self.parent.groups_stats[group["group_name"]]
+                if not stats.count:
+                    continue
+                gp_avg = stats.mean()
+                gp_min = stats.minimum
+                gp_max = stats.maximum
                 self.data_table.setItem(i + j, 1, QtGui.QTableWidgetItem(str(gp_avg)))
                 self.data_table.setItem(i + j, 2, QtGui.QTableWidgetItem(str(gp_min)))
                 self.data_table.setItem(i + j, 3, QtGui.QTableWidgetItem(str(gp_max)))
@@ -530,6 +469,19 @@ class GUI(QtWidgets.QMainWindow):
         self.b = board
         self.args = args
         self.rail_buf = []
+        self.rails_stats = {}
+        self.groups_stats = {}
+        self.rails_index = {}
+        self.groups_index = {}
+        self.rails_plot = {}
+        self.groups_plot = {}
+        self.main_curves = {}  # DecimatedCurve drawn by each global plot trace
+        self.zoom_view = None  # zoom region and width of the previous zoom plot draw
+        self.zoom_end = None  # last sample time at the previous zoom plot draw
+        self.data_end = None
+        self.right_lay_plotted = {}  # rails drawn in black in the right layout
+        self.refresh_period = int(1000 / program_config.GUI_REFRESH_RATE)
+        self.samples_cursor = self.b.samples.subscribe() if self.b.samples else None
         self.groups_buf = []
         self.temperature_buf = []
         self.list_power_plot_main = []
@@ -592,6 +544,8 @@ class GUI(QtWidgets.QMainWindow):
         self.thread_temperature = QtCore.QThread(parent=self)
         self.worker_temperature = Worker(self.b, "temperature")
         self.thread_process_data = ProcessData(self)
+        self.new_samples = []  # samples fetched, not in the histories yet
+        self.exports = []  # ExportData threads running
         signal.signal(signal.SIGINT, self.sigint_handler)
         self.start_setup()
 
@@ -609,6 +563,8 @@ class GUI(QtWidgets.QMainWindow):
         ):
             self.worker.resume_thread()
             drv_ftdi.FLAG_UI_STOP = True
+            for export in self.exports:
+                export.wait()
             self.thread_data.quit()
             self.thread_data.wait()
             self.thread_temperature.quit()
@@ -619,6 +575,8 @@ class GUI(QtWidgets.QMainWindow):
         """function called when app is quit by clicking the red cross"""
         self.worker.resume_thread()
         drv_ftdi.FLAG_UI_STOP = True
+        for export in self.exports:
+            export.wait()
         self.thread_data.quit()
         self.thread_data.wait()
         self.thread_temperature.quit()
@@ -660,54 +618,32 @@ class GUI(QtWidgets.QMainWindow):
                 np.array(self.temperature_buf)[:, 1],
             )
         if type == "group":
-            trace_main.setData(
-                self.groups_buf[index]["power"][:, 0],
-                self.groups_buf[index]["power"][:, 1],
-            )
-            trace_zoom.setData(
-                self.groups_buf[index]["power"][:, 0],
-                self.groups_buf[index]["power"][:, 1],
-            )
-        if type == "power":
-            rail = next(
-                (
-                    item
-                    for item in self.rail_buf
-                    if item["railnumber"] == self.b.rails_to_display[index]["name"]
-                ),
-                None,
-            )
-            voltage = rail["voltage"][1:]
-            current = rail["current"][1:]
-            power = np.empty_like(voltage)
-            power[:, 0] = voltage[:, 0]
-            power[:, 1] = voltage[:, 1] * current[:, 1]
-            trace_main.setData(power[:, 0], power[:, 1])
-            trace_zoom.setData(power[:, 0], power[:, 1])
-        if type == "voltage":
-            rail = next(
-                (
-                    item
-                    for item in self.rail_buf
-                    if item["railnumber"] == self.b.rails_to_display[index]["name"]
-                ),
-                None,
-            )
-            voltage = rail["voltage"][1:]
-            trace_main.setData(voltage[:, 0], voltage[:, 1])
-            trace_zoom.setData(voltage[:, 0], voltage[:, 1])
-        if type == "current":
-            rail = next(
-                (
-                    item
-                    for item in self.rail_buf
-                    if item["railnumber"] == self.b.rails_to_display[index]["name"]
-                ),
-                None,
-            )
-            current = rail["current"][1:]
-            trace_main.setData(current[:, 0], current[:, 1])
-            trace_zoom.setData(current[:, 0], current[:, 1])
+            pyramid = self.groups_plot[self.groups_buf[index]["group_name"]]
+        elif type in ("power", "voltage", "current"):
+            pyramid = self.rails_plot[self.b.rails_to_display[index]["name"]][type]
+        else:
+            return
+        self.draw_main(trace_main, pyramid)
+        minx, maxx = self.zoom_region.getRegion()
+        trace_zoom.setData(*pyramid.window(minx, maxx, self.zoom_graph.width()))
+
+    def draw_main(self, trace, pyramid):
+        """draws a global plot trace, extending it with the samples arrived since its previous draw"""
+        curve = self.main_curves.get(trace)
+        if curve is None or curve.pyramid is not pyramid:
+            curve = self.main_curves[trace] = data_buffer.DecimatedCurve(pyramid)
+        trace.setData(*curve.update(self.global_graph.width()))
+
+    def update_histories(self):
+        """appends the samples fetched by ProcessData to the rail and group histories, in the GUI thread reading
+        them, and updates the plots"""
+        while self.new_samples:
+            new_samples = self.new_samples.pop(0)
+            for rail, (t, vbus, vsense, scale) in zip(self.rail_buf, new_samples):
+                rail.append(t, vbus, vsense, scale, self.b.samples.scales)
+        for group in self.groups_buf:
+            group.update()
+        self.traces_update()
 
     def traces_update(self):
         """updates global / zoom plot and updates values"""
@@ -721,43 +657,30 @@ class GUI(QtWidgets.QMainWindow):
 
         maxx = None
         for i, d_rail in enumerate(self.b.rails_to_display):
-            rail = next(
-                (
-                    item
-                    for item in self.rail_buf
-                    if item["railnumber"] == d_rail["name"]
-                ),
-                None,
-            )
-            maxx = rail["voltage"][-1][0]
-            if rail is None or len(rail["voltage"]) <= 1:
+            time = self.rails_index[d_rail["name"]]["time"].view()
+            if not len(time):
                 return
-            voltage = rail["voltage"][1:]
-            current = rail["current"][1:]
-            power = np.empty_like(voltage)
-            power[:, 0] = voltage[:, 0]
-            power[:, 1] = voltage[:, 1] * current[:, 1]
+            maxx = time[-1]
+            plots = self.rails_plot[d_rail["name"]]
             if self.list_rails_p[i].isChecked():
-                self.list_power_plot_main[i].setData(power[:, 0], power[:, 1])
-                self.list_power_plot_zoom[i].setData(power[:, 0], power[:, 1])
+                self.draw_main(self.list_power_plot_main[i], plots["power"])
 
             if self.list_rails_c[i].isChecked():
-                self.list_current_plot_main[i].setData(current[:, 0], current[:, 1])
-                self.list_current_plot_zoom[i].setData(current[:, 0], current[:, 1])
+                self.draw_main(self.list_current_plot_main[i], plots["current"])
 
             if self.list_rails_v[i].isChecked():
-                self.list_voltage_plot_main[i].setData(voltage[:, 0], voltage[:, 1])
-                self.list_voltage_plot_zoom[i].setData(voltage[:, 0], voltage[:, 1])
+                self.draw_main(self.list_voltage_plot_main[i], plots["voltage"])
 
         for j, group in enumerate(self.groups_buf):
-            maxx = group["power"][-1][0] if maxx is None else maxx
+            time = self.groups_index[group["group_name"]]["time"].view()
+            if maxx is None and len(time):
+                maxx = time[-1]
             if self.list_groups_p[j].isChecked():
-                self.list_group_plot_main[j].setData(
-                    group["power"][:, 0], group["power"][:, 1]
-                )
-                self.list_group_plot_zoom[j].setData(
-                    group["power"][:, 0], group["power"][:, 1]
+                self.draw_main(
+                    self.list_group_plot_main[j],
+                    self.groups_plot[group["group_name"]],
                 )
+        self.data_end = maxx
 
         if self.b.temperature_sensor and self.list_groups_t[0].isChecked():
             if len(self.temperature_buf) > 1:
@@ -777,6 +700,7 @@ class GUI(QtWidgets.QMainWindow):
             self.zoom_region.setRegion((minx, maxx))
             self.zoom_graph.enableAutoRange("y")
             self.zoom_graph.setXRange(minx, maxx, padding=0)
+        self.zoom_traces_update()
 
         for reg in self.stop_region:
             if reg not in self.global_graph_pi.vb.allChildren():
@@ -790,44 +714,64 @@ class GUI(QtWidgets.QMainWindow):
         self.update_zoom_data()
         self.update_right_lay_data()
 
+    def zoom_traces_update(self):
+        """updates zoom plot with the finest level fitting the zoom region, when the region or its data changed"""
+        minx, maxx = self.zoom_region.getRegion()
+        pixels = self.zoom_graph.width()
+        if (minx, maxx, pixels) == self.zoom_view and (
+            self.zoom_end == self.data_end or self.zoom_end >= maxx
+        ):
+            return
+        self.zoom_view = (minx, maxx, pixels)
+        self.zoom_end = self.data_end
+        for i, d_rail in enumerate(self.b.rails_to_display):
+            plots = self.rails_plot[d_rail["name"]]
+            if self.list_rails_p[i].isChecked():
+                self.list_power_plot_zoom[i].setData(
+                    *plots["power"].window(minx, maxx, pixels)
+                )
+            if self.list_rails_c[i].isChecked():
+                self.list_current_plot_zoom[i].setData(
+                    *plots["current"].window(minx, maxx, pixels)
+                )
+            if self.list_rails_v[i].isChecked():
+                self.list_voltage_plot_zoom[i].setData(
+                    *plots["voltage"].window(minx, maxx, pixels)
+                )
+
+        for j, group in enumerate(self.groups_buf):
+            if self.list_groups_p[j].isChecked():
+                self.list_group_plot_zoom[j].setData(
+                    *self.groups_plot[group["group_name"]].window(minx, maxx, pixels)
+                )
+
     def update_right_lay_data(self):
         """updates average values of plotted rails and groups"""
         for j, group in enumerate(self.groups_buf):
-            p_avg = group["power"][:, 1].mean()
+            p_avg = self.groups_stats[group["group_name"]].mean()
             self.list_right_lay_group_p[j].setText(str("%.2f" % p_avg))
 
         for i, d_rail in enumerate(self.b.rails_to_display):
-            if (
+            plotted = (
                 self.list_rails_p[i].isChecked()
                 or self.list_rails_v[i].isChecked()
                 or self.list_rails_c[i].isChecked()
-            ):
-                rail = next(
-                    (
-                        item
-                        for item in self.rail_buf
-                        if item["railnumber"] == d_rail["name"]
-                    ),
-                    None,
-                )
-                voltage = rail["voltage"][1:, 1]
-                current = rail["current"][1:, 1]
-                power = voltage * current
-                p_avg = power.mean()
-                v_avg = voltage.mean()
-                c_avg = current.mean()
+            )
+            if plotted:
+                stats = self.rails_stats[d_rail["name"]]
+                p_avg = stats["power"].mean()
+                v_avg = stats["voltage"].mean()
+                c_avg = stats["current"].mean()
                 self.list_right_lay_p[i].setText(str("%.2f" % p_avg))
                 self.list_right_lay_v[i].setText(str("%.2f" % v_avg))
                 self.list_right_lay_c[i].setText(str("%.2f" % c_avg))
-                self.list_right_lay_n[i].setStyleSheet("color: black")
-                self.list_right_lay_p[i].setStyleSheet("color: black")
-                self.list_right_lay_v[i].setStyleSheet("color: black")
-                self.list_right_lay_c[i].setStyleSheet("color: black")
-            else:
-                self.list_right_lay_n[i].setStyleSheet("color: grey")
-                self.list_right_lay_p[i].setStyleSheet("color: grey")
-                self.list_right_lay_v[i].setStyleSheet("color: grey")
-                self.list_right_lay_c[i].setStyleSheet("color: grey")
+            if self.right_lay_plotted.get(i) != plotted:
+                color = "color: black" if plotted else "color: grey"
+                self.list_right_lay_n[i].setStyleSheet(color)
+                self.list_right_lay_p[i].setStyleSheet(color)
+                self.list_right_lay_v[i].setStyleSheet(color)
+                self.list_right_lay_c[i].setStyleSheet(color)
+                self.right_lay_plotted[i] = plotted
 
     def update_zoom_view(self):
         """updates zoom view"""
@@ -848,6 +792,7 @@ class GUI(QtWidgets.QMainWindow):
         self.zoom_region.blockSignals(True)
         rgn = viewrange[0]
         self.zoom_region.setRegion(rgn)
+        self.zoom_traces_update()
         self.update_zoom_data()
         self.zoom_region.blockSignals(False)
 
@@ -859,6 +804,7 @@ class GUI(QtWidgets.QMainWindow):
         self.zoom_region.setZValue(10)
         minx, maxx = self.zoom_region.getRegion()
         self.zoom_graph.setXRange(minx, maxx, padding=0)
+        self.zoom_traces_update()
         self.update_zoom_data()
 
         self.zoom_region.blockSignals(False)
@@ -1046,6 +992,43 @@ class GUI(QtWidgets.QMainWindow):
             pg.mkPen(TEMP_COLORS[0], width=2, style=QtCore.Qt.DashDotDotLine)
         )
 
+    def snapshot(self):
+        """returns snapshots of the rails, groups and temperature captured so far, that the exports write while
+        the capture goes on"""
+        rails = [rail.snapshot() for rail in self.rail_buf]
+        names = {rail.name: rail for rail in rails}
+        groups = [
+            group.snapshot([names[rail.name] for rail in group.rails])
+            for group in self.groups_buf
+        ]
+        temperature = None
+        if self.b.temperature_sensor:
+            temperature = np.array(self.temperature_buf, dtype=np.float64)
+            temperature = temperature.reshape(-1, 2)
+        return rails, groups, temperature
+
+    def start_export(self, write, path, *args):
+        """starts an ExportData thread, its progress being displayed in a dialog able to cancel it"""
+        print("Saving to file " + path)
+        dialog = QtWidgets.QProgressDialog("Saving " + path, "Cancel", 0, 100, self)
+        dialog.setWindowTitle("Export")
+        dialog.setWindowModality(QtCore.Qt.NonModal)
+        export = ExportData(self, write, path, *args)
+        export.sig_progress.connect(dialog.setValue)
+        dialog.canceled.connect(export.cancel)
+        export.finished.connect(lambda: self.end_export(export, dialog))
+        self.exports.append(export)
+        export.start()
+
+    def end_export(self, export, dialog):
+        self.exports.remove(export)
+        dialog.canceled.disconnect()
+        dialog.close()
+        if export.done:
+            print("Saved data in file " + export.path)
+        else:
+            print("File " + export.path + " not saved")
+
     def save_pmt(self):
         """saves the capture as binary file with specified name"""
         name = QtGui.QFileDialog.getSaveFileName(
@@ -1055,99 +1038,33 @@ class GUI(QtWidgets.QMainWindow):
         if name[0]:
             filename = os.path.splitext(name[0])[0]
             filename += ".pmt"
-            file_out = open(filename, "wb")
-            print("Saving to binary file " + str(filename))
-            pickle.dump(self.rail_buf, file_out, -1)
-            pickle.dump(self.groups_buf, file_out, -1)
-            if self.b.temperature_sensor:
-                pickle.dump(self.temperature_buf, file_out, -1)
-            file_out.close()
-            print("Done.")
+            rails, groups, temperature = self.snapshot()
+            self.start_export(
+                capture_file.write_histories,
+                filename,
+                self.b.name,
+                rails,
+                groups,
+                temperature,
+            )
 
     def save_csv(self):
         """saves the capture as csv file with specified name"""
-        headers = []
-        data = []
         name = QtGui.QFileDialog.getSaveFileName(
             caption="Save captured data as csv file", filter="csv"
         )
         if name[0]:
-            filename = os.path.splitext(name[0])
-            if filename:
-                type_data = ["voltage", "current", "power"]
-                type_data_unit = [" (V)", " (mA)", " (mW)"]
-                array_size = self.rail_buf[-1]["voltage"].shape[0]
-                data.append(self.rail_buf[0]["voltage"][1:array_size, 0])
-                headers.append("Time (ms)")
-                for d_rail in self.b.rails_to_display:
-                    rail = next(
-                        (
-                            item
-                            for item in self.rail_buf
-                            if item["railnumber"] == d_rail["name"]
-                        ),
-                        None,
-                    )
-                    for j in range(3):
-                        headers.append(
-                            str(d_rail["name"] + " " + type_data[j] + type_data_unit[j])
-                        )
-                        if j != 2:
-                            data.append(rail[type_data[j]][1:array_size, 1])
-                        else:
-                            data.append(
-                                rail["current"][1:array_size, 1]
-                                * rail["voltage"][1:array_size, 1]
-                            )
-                if self.b.power_groups:
-                    for group in self.b.power_groups:
-                        power_group = np.array([[0, 0]], dtype=np.float16)
-                        headers.append(group["name"] + " power (mW)")
-                        for rail_group in group["rails"]:
-                            rail = next(
-                                (
-                                    item
-                                    for item in self.rail_buf
-                                    if item["railnumber"] == rail_group
-                                ),
-                                None,
-                            )
-                            power_rail = np.empty_like(rail["voltage"][1:array_size])
-                            power_rail[:, 0] = rail["voltage"][1:array_size, 0]
-                            power_rail[:, 1] = (
-                                rail["voltage"][1:array_size, 1]
-                                * rail["current"][1:array_size, 1]
-                            )
-                            if power_group.shape[0] > power_rail.shape[0]:
-                                power_group.resize(power_rail.shape, refcheck=False)
-                            elif power_rail.shape[0] - power_group.shape[0] <= 2:
-                                power_rail.resize(power_group.shape)
-                            power_group = power_group + power_rail
-                        data.append(power_group[:, 1])
-                if self.b.temperature_sensor:
-                    csv_temperature_buf = self.process_temperature_csv_export()
-                    headers.append("Temperature (°C)")
-                    data.append(np.array(csv_temperature_buf)[:, 1])
-                np.savetxt(
-                    filename[0] + ".csv",
-                    np.column_stack(data),
-                    delimiter=",",
-                    header=",".join(headers),
-                    fmt="%1.4f",
-                    comments="",
-                )
-                print("Saved data in file " + filename[0] + ".csv")
-
-    def process_temperature_csv_export(self):
-        processed_temperature_buf = []
-        ind = 0
-        len_power_buf = len(self.rail_buf[-1]["voltage"])
-        len_temp_buf = len(self.temperature_buf)
-        for i in range(1, len_power_buf):
-            processed_temperature_buf.append(self.temperature_buf[ind])
-            if i == int((len_power_buf / len_temp_buf) * (ind + 1)):
-                ind += 1
-        return processed_temperature_buf
+            filename = os.path.splitext(name[0])[0]
+            filename += ".csv"
+            rails, groups, temperature = self.snapshot()
+            names = {rail.name: rail for rail in rails}
+            rows = csv_export.CsvRows(
+                rails[0],
+                [names[d_rail["name"]] for d_rail in self.b.rails_to_display],
+                [[group.name, group.rails] for group in groups],
+                temperature is not None,
+            )
+            self.start_export(csv_export.write_csv, filename, rows, temperature)
 
     def save_png(self):
         """saves the capture as png picture with specified name"""
@@ -1157,11 +1074,13 @@ class GUI(QtWidgets.QMainWindow):
         if name[0]:
             filename = os.path.splitext(name[0])[0]
             filename += ".png"
-            time.sleep(1)
-            screen = QtGui.QApplication.primaryScreen()
-            screenshot = screen.grabWindow(self.winId())
-            screenshot.save(filename, "png")
-            print("Saved image to: ", filename)
+            QtCore.QTimer.singleShot(1000, lambda: self.grab_png(filename))
+
+    def grab_png(self, filename):
+        """saves a screenshot of the window, once the file dialog is closed"""
+        screen = QtGui.QApplication.primaryScreen()
+        screenshot = screen.grabWindow(self.winId()).toImage()
+        self.start_export(write_png, filename, screenshot)
 
     def display_about(self):
         msg = QtWidgets.QMessageBox()
@@ -1183,13 +1102,11 @@ class GUI(QtWidgets.QMainWindow):
                 self.stop_region.clear()
                 drv_ftdi.T_START = time.time()
                 drv_ftdi.DATA_LOCK.acquire()
-                for rail in self.b.data_buf:
-                    rail["current"] = [[0, 0]]
-                    rail["voltage"] = [[0, 0]]
+                self.b.samples.skip(self.samples_cursor)
                 drv_ftdi.DATA_LOCK.release()
 
                 self.worker.resume_thread()
-                self.timer.start(1000)
+                self.timer.start(self.refresh_period)
 
                 if self.b.temperature_sensor:
                     drv_ftdi.TEMP_DATA_LOCK.acquire()
@@ -1223,7 +1140,7 @@ class GUI(QtWidgets.QMainWindow):
             self.redo_but.setChecked(False)
             if self.state == "stop":
                 self.worker.resume_thread()
-                self.timer.start(1000)
+                self.timer.start(self.refresh_period)
                 self.resume = time.time() - drv_ftdi.T_START
                 region = pg.LinearRegionItem(
                     brush=QtGui.QBrush(QtGui.QColor(255, 0, 0, 50)), movable=False
@@ -1261,19 +1178,20 @@ class GUI(QtWidgets.QMainWindow):
                 self.state = "pause"
             else:
                 self.status_bar.showMessage("Recording")
-                self.timer.start(1000)
+                self.timer.start(self.refresh_period)
                 self.state = "start"
 
     def redo_record(self):
         """re initialization of the shared variable containing measured values"""
         self.stop_record()
         for rail in self.rail_buf:
-            rail["current"] = np.zeros((2, 2), dtype=np.float16)
-            rail["voltage"] = np.zeros((2, 2), dtype=np.float16)
+            rail.reset()
         if self.b.temperature_sensor:
-            self.temperature_buf = np.zeros((2, 2), dtype=np.float16)
+            self.temperature_buf = np.zeros((2, 2), dtype=np.float64)
         for group in self.groups_buf:
-            group = []
+            group.reset()
+        self.main_curves = {}
+        self.zoom_view = None
         self.zoom_graph.clear()
         self.zoom_graph_vb.clear()
         self.global_graph.clear()
@@ -1327,6 +1245,22 @@ class GUI(QtWidgets.QMainWindow):
     def pac_bipolar(self):
         self.b.pac_set_bipolar()
 
+    def attach_histories(self):
+        """points the statistics, indexes and plot pyramids at the ones of the rail and group histories"""
+        for rail in self.rail_buf:
+            self.rails_stats[rail.name] = rail.stats
+            self.rails_index[rail.name] = {
+                "time": rail.time,
+                "voltage": rail.sums["voltage"],
+                "current": rail.sums["current"],
+                "power": rail.sums["power"],
+            }
+            self.rails_plot[rail.name] = rail.pyramids
+        for group in self.groups_buf:
+            self.groups_stats[group.name] = group.stats
+            self.groups_index[group.name] = {"time": group.time, "power": group.sums}
+            self.groups_plot[group.name] = group.pyramid
+
     def start_setup(self):
         """setup of the application"""
         self.setCentralWidget(self.central_widget)
@@ -1335,120 +1269,94 @@ class GUI(QtWidgets.QMainWindow):
         if self.args.load:
             self.setWindowTitle("Power Measurement Tool Offline")
             print("Reading %s file..." % self.args.load)
+            temperature_buf = None
             if self.args.load.split(".")[-1] == "csv":
-                with open(self.args.load, mode="r") as csv_file:
-                    csv_reader = csv.reader(csv_file, delimiter=",")
-                    self.b.rails_to_display = []
-                    self.b.power_groups = []
-                    first_run = True
-                    for row in csv_reader:
-                        if first_run:
-                            last_el = ""
-                            for r in row[1:]:
-                                if r.split(" ")[0] == last_el:
-                                    pass
-                                elif not (
-                                    "GROUP" in r.split(" ")[0]
-                                    or "Temperature" in r.split(" ")[0]
-                                ):
-                                    self.b.rails_to_display.append(
-                                        {"name": r.split(" ")[0]}
-                                    )
-                                    self.rail_buf.append(
-                                        {
-                                            "railnumber": r.split(" ")[0],
-                                            "current": np.array(
-                                                [[0, 0]], dtype=np.float16
-                                            ),
-                                            "voltage": np.array(
-                                                [[0, 0]], dtype=np.float16
-                                            ),
-                                        }
-                                    )
-                                    last_el = r.split(" ")[0]
-                                elif "GROUP" in r.split(" ")[0]:
-                                    self.b.power_groups.append(
-                                        {"name": r.split(" ")[0]}
-                                    )
-                                    self.groups_buf.append(
-                                        {
-                                            "group_name": r.split(" ")[0],
-                                            "power": np.array(
-                                                [[0, 0]], dtype=np.float16
-                                            ),
-                                        }
-                                    )
-                                    last_el = r.split(" ")[0]
-                                elif "Temperature" in r.split(" ")[0]:
-                                    self.b.temperature_sensor = True
-                            first_run = False
-                        else:
-                            ind = 0
-                            for i in range(1, len(self.rail_buf) * 3, 3):
-                                self.rail_buf[ind]["current"] = np.append(
-                                    self.rail_buf[ind]["current"],
-                                    np.array(
-                                        [[float(row[0]), float(row[i + 1])]],
-                                        dtype=np.float16,
-                                    ),
-                                    axis=0,
-                                )
-                                self.rail_buf[ind]["voltage"] = np.append(
-                                    self.rail_buf[ind]["voltage"],
-                                    np.array(
-                                        [[float(row[0]), float(row[i])]],
-                                        dtype=np.float16,
-                                    ),
-                                    axis=0,
-                                )
-                                ind += 1
-
-                            ind_g = 0
-                            for i in range(1, len(self.groups_buf) + 1):
-                                self.groups_buf[ind_g]["power"] = np.append(
-                                    self.groups_buf[ind_g]["power"],
-                                    np.array(
-                                        [[row[0], row[(ind * 3) + i]]], dtype=np.float16
-                                    ),
-                                    axis=0,
-                                )
-                                ind_g += 1
-
-                            if self.b.temperature_sensor:
-                                self.temperature_buf.append(
-                                    [int(float(row[0])), int(float(row[-1]))]
-                                )
-
+                (
+                    self.rail_buf,
+                    self.groups_buf,
+                    temperature_buf,
+                ) = csv_export.read_csv(self.args.load)
             elif self.args.load.split(".")[-1] == "pmt":
-                with open(self.args.load, mode="rb") as pkl_file:
-                    self.rail_buf = pickle.load(pkl_file)
-                    self.b.rails_to_display = []
-                    for rail in self.rail_buf:
-                        self.b.rails_to_display.append({"name": rail["railnumber"]})
-                    try:
-                        self.groups_buf = pickle.load(pkl_file)
-                        self.b.power_groups = []
-                        for group in self.groups_buf:
-                            self.b.power_groups.append({"name": group["group_name"]})
-                    except EOFError:
-                        self.b.power_groups = []
-                    try:
-                        self.temperature_buf = pickle.load(pkl_file)
-                        self.b.temperature_sensor = True
-                    except EOFError:
-                        self.temperature_buf = []
+                if capture_file.is_capture(self.args.load):
+                    (
+                        _,
+                        self.rail_buf,
+                        self.groups_buf,
+                        temperature_buf,
+                    ) = capture_file.open_capture(self.args.load)
+                else:
+                    (
+                        self.rail_buf,
+                        self.groups_buf,
+                        temperature_buf,
+                    ) = capture_file.read_legacy(self.args.load)
             else:
                 print("Please enter valid file to load")
+            self.b.rails_to_display = [
+                {"name": rail["railnumber"]} for rail in self.rail_buf
+            ]
+            self.b.power_groups = [
+                {"name": group["group_name"]} for group in self.groups_buf
+            ]
+            self.b.temperature_sensor = temperature_buf is not None
+            self.temperature_buf = (
+                [] if temperature_buf is None else list(temperature_buf)
+            )
+            if self.rail_buf and isinstance(self.rail_buf[0], data_buffer.RailHistory):
+                self.attach_histories()
+            else:
+                for rail in self.rail_buf:
+                    name = rail["railnumber"]
+                    time = data_buffer.GrowableArray(rail["voltage"][1:, 0])
+                    self.rails_stats[name] = {}
+                    self.rails_index[name] = {"time": time}
+                    self.rails_plot[name] = {}
+                    for key, values in (
+                        ("voltage", rail["voltage"][1:, 1]),
+                        ("current", rail["current"][1:, 1]),
+                        ("power", rail["voltage"][1:, 1] * rail["current"][1:, 1]),
+                    ):
+                        self.rails_stats[name][key] = data_buffer.RunningStats(values)
+                        self.rails_index[name][key] = data_buffer.PrefixSums(
+                            time,
+                            lambda start, stop, values=values: values[start:stop],
+                            key == "power",
+                        )
+                        self.rails_index[name][key].append(time.view(), values)
+                        self.rails_plot[name][key] = data_buffer.MinMaxPyramid(
+                            time, lambda start, stop, values=values: values[start:stop]
+                        )
+                        self.rails_plot[name][key].append(time.view(), values)
+                for group in self.groups_buf:
+                    name = group["group_name"]
+                    time = data_buffer.GrowableArray(group["power"][:, 0])
+                    values = group["power"][:, 1]
+                    self.groups_stats[name] = data_buffer.RunningStats(values)
+                    self.groups_index[name] = {
+                        "time": time,
+                        "power": data_buffer.PrefixSums(
+                            time,
+                            lambda start, stop, values=values: values[start:stop],
+                            True,
+                        ),
+                    }
+                    self.groups_index[name]["power"].append(time.view(), values)
+                    self.groups_plot[name] = data_buffer.MinMaxPyramid(
+                        time, lambda start, stop, values=values: values[start:stop]
+                    )
+                    self.groups_plot[name].append(time.view(), values)
 
         if not self.args.load:
-            for i, rail in enumerate(self.b.board_mapping_power):
-                self.rail_buf.append(
-                    {
-                        "railnumber": rail["name"],
-                        "current": [[0, 0]],
-                        "voltage": [[0, 0]],
-                    }
+            for rail in self.b.board_mapping_power:
+                self.rail_buf.append(data_buffer.RailHistory(rail["name"]))
+            rails = {rail["railnumber"]: rail for rail in self.rail_buf}
+            for group in self.b.power_groups:
+                self.groups_buf.append(
+                    data_buffer.GroupHistory(
+                        group["name"], [rails[name] for name in group["rails"]]
+                    )
                 )
+            self.attach_histories()
             self.setWindowTitle("Power Measurement Tool Live Capture")
             self.menu_bar.setNativeMenuBar(False)
             self.filemenu = self.menu_bar.addMenu("File")
@@ -1885,13 +1793,13 @@ class GUI(QtWidgets.QMainWindow):
                 )
                 self.thread_temperature.start()
 
-            self.thread_process_data.sig_update_gui.connect(self.traces_update)
+            self.thread_process_data.sig_update_gui.connect(self.update_histories)
             self.thread_process_data.sig_update_instant_temp.connect(
                 self.update_instant_temp
             )
             self.thread_process_data.finished.connect(self.thread_process_data.quit)
             self.timer.timeout.connect(self.thread_process_data.start)
-            self.timer.start(1000)
+            self.timer.start(self.refresh_period)
             self.start_but.setChecked(True)
         else:
             self.traces_update()
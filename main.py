@@ -240,6 +240,21 @@ def main():
         help="monitor in TUI during specified time",
         metavar="time",
     )
+    parser_monitor.add_argument(
+        "-r",
+        "--rate",
+        required=False,
+        type=int,
+        choices=[1024, 256, 64, 8],
+        help="PAC sample rate in samples per second",
+        metavar="rate",
+    )
+    parser_monitor.add_argument(
+        "--single-shot",
+        required=False,
+        action="store_true",
+        help="PAC single-shot conversion at each read",
+    )
 
     parser_resume = subparser.add_parser("resume", help="resume / suspend the board")
     parser_resume.add_argument(
@@ -350,6 +365,7 @@ def main():
         board = drv_ftdi.Board(args)
         if not args.boot_mode or found_bootm(args.boot_mode, board):
             board.reset(args.boot_mode, args.delay)
+            board.close_system()
         else:
             logging.warning("Please enter valid boot mode")
 
@@ -360,6 +376,7 @@ def main():
             foundvalue = found_value(args.value)
             if foundvalue >= 0:
                 board.set_gpio(foundgpio, foundvalue)
+                board.close_system()
             else:
                 logging.warning("Please enter valid GPIO value")
         else:
@@ -45,3 +45,70 @@ RAILS_TO_PROBE = ["all"]
 # The offset is deduce to the current limit. Higher is the offset, more restrictive is the switching.
 # If current limit is 10mA with an offset of 10%, the average current should be < to 9mA to allow the shunt switching.
 LOW_SWITCH_RESISTANCE_OFFSET = 10
+
+# PAC refresh strategy of the acquisition loop.
+# With "pac", each PAC gets its own REFRESH command just before being read, rails of different PACs are
+# sampled at different instants. With "general", a single REFRESH_G general call is sent per scan, all
+# the PACs latch their measurements at the same time and the rails share the same timestamp.
+PAC_REFRESH_MODE = "pac"
+
+# In accumulator mode, the PACs sample continuously and every PAC_ACCUMULATOR_PERIOD sec the tool reads their
+# accumulated power (VPOWER_ACC) and number of conversions (ACC_COUNT). It gives the exact energy and average power
+# of each rail whatever the poll rate, the current displayed is the average current since the previous read.
+PAC_ACCUMULATOR_MODE = False
+PAC_ACCUMULATOR_PERIOD = 0.1
+
+# Conversion rate of the PACs in samples per second (1024, 256, 64 or 8), written in their CTRL register.
+# PAC_SAMPLE_RATES overrides it per board, for all its PACs or per PAC number of the board mapping_power,
+# e.g. {"imx8dxlevk": 256, "imx8mpevkpwra0": {1: 64, 2: 8}}. A PAC is not read more often than its conversion
+# rate, so the same conversion is never stored twice. With PAC_SINGLE_SHOT, the PACs do a single conversion cycle
+# per REFRESH and sleep in between, they are then read as fast as possible.
+PAC_SAMPLE_RATE = 1024
+PAC_SAMPLE_RATES = {}
+PAC_SINGLE_SHOT = False
+
+# Retention window in sec of the samples shared by the acquisition thread with the TUI, GUI and server clients.
+# Each of them reads the samples from its own position, a consumer not reading within this window loses the oldest
+# ones. The buffer is sized for 1024 SPS per rail and each sample takes 16 bytes.
+SAMPLE_RETENTION = 16
+
+# Refresh rate of the GUI in Hz: new samples are fetched and the plots, averages and data windows are updated
+# at this rate. Only the samples arrived since the previous refresh are added to the plots, 10 to 30 Hz keeps the
+# live monitoring smooth without saturating a core.
+GUI_REFRESH_RATE = 10
+
+# The .pmt captures store the timestamps and raw PAC codes of each rail in chunks of CAPTURE_CHUNK_ROWS samples.
+# With CAPTURE_COMPRESSOR = "zlib" each chunk is compressed, the file is smaller but slower to write and read.
+CAPTURE_CHUNK_ROWS = 65536
+CAPTURE_COMPRESSOR = None
+
+"""
+######################### FTDI backend #########################
+By default ("auto"), the FTDI chip is driven with pylibftdi on Linux and ftd2xx on Windows.
+With "sim", the FTDI chip and the I2C devices of the boards listed in SIM_BOARDS are emulated by ftdi_sim.py,
+so the tool can run without any board connected (benchmarks, regression tests).
+The environment variable PMT_FTDI_BACKEND overrides this value.
+"""
+FTDI_BACKEND = "auto"
+
+# "replay" feeds back the FTDI traffic recorded in FTDI_REPLAY_FILE (PMT_FTDI_REPLAY_FILE environment variable).
+# When FTDI_RECORD_FILE (PMT_FTDI_RECORD_FILE) is set, the traffic following the board detection is recorded in it.
+FTDI_REPLAY_FILE = ""
+FTDI_RECORD_FILE = ""
+
+SIM_BOARDS = ["imx8dxlevk"]
+
+# Time in sec added to each simulated USB round trip, a real FT4232H answers in about 1 ms.
+SIM_USB_LATENCY = 0.001
+
+# Load seen by the simulated PACs, per rail name ("default" is used for the other rails).
+# shape can be "dc", "sine", "square" or "noise", voltage in V, current and amplitude in mA, period in sec.
+SIM_LOADS = {
+    "default": {
+        "shape": "sine",
+        "voltage": 1.8,
+        "current": 50,
+        "amplitude": 20,
+        "period": 2,
+    },
+}
@@ -31,10 +31,9 @@
 import datetime
 import netifaces
 import threading
-import copy
 import socket
-import numpy as np
 
+import data_buffer
 import drv_ftdi
 
 HOST = "0.0.0.0"
@@ -43,16 +42,12 @@ STOP_THREAD = False
 
 def client_thread(board, conn, addr):
     global STOP_THREAD
-    last_sec_len_buf = 0
     rail_buf = []
-    for i, rail in enumerate(board.board_mapping_power):
-        rail_buf.append(
-            {
-                "railnumber": rail["name"],
-                "current": np.array([[0, 0]], dtype=np.float16),
-                "voltage": np.array([[0, 0]], dtype=np.float16),
-            }
-        )
+    samples_cursor = board.samples.subscribe()
+    for rail in board.board_mapping_power:
+        rail_buf.append(data_buffer.RailHistory(rail["name"], indexed=False))
+    sent = [0] * len(rail_buf)  # samples of each rail already in a reply
+    power = [float("nan")] * len(rail_buf)
     while not STOP_THREAD:
         try:
             d = conn.recv(1024)
@@ -61,43 +56,27 @@ def client_thread(board, conn, addr):
         except socket.error as err:
             print("error while receiving:: " + str(err))
             break
-        remote_buf = []
         drv_ftdi.DATA_LOCK.acquire()
-        for remote_rail in board.data_buf:
-            remote_buf.append(copy.deepcopy(remote_rail))
-            remote_rail["current"] = [[0, 0]]
-            remote_rail["voltage"] = [[0, 0]]
+        new_samples = board.samples.fetch(samples_cursor)
         drv_ftdi.DATA_LOCK.release()
 
-        for rail in remote_buf:
-            local_rail = next(
-                (item for item in rail_buf if item["railnumber"] == rail["railnumber"]),
-                None,
-            )
-            rail["voltage"].pop(0)
-            rail["current"].pop(0)
-            local_rail["voltage"] = np.append(
-                local_rail["voltage"],
-                np.array(rail["voltage"], dtype=np.float16),
-                axis=0,
-            )
-            local_rail["current"] = np.append(
-                local_rail["current"],
-                np.array(rail["current"], dtype=np.float16),
-                axis=0,
-            )
+        for rail, (t, vbus, vsense, scale) in zip(rail_buf, new_samples):
+            rail.append(t, vbus, vsense, scale, board.samples.scales)
         data = datetime.datetime.now().isoformat() + ";"
-        curr_len_buf = len(rail_buf[-1]["voltage"])
-        rail_buf_len = curr_len_buf - last_sec_len_buf
-        for d_rail in rail_buf:
-            tmp_v = d_rail["voltage"][-rail_buf_len:, 1].mean()
-            tmp_c = d_rail["current"][-rail_buf_len:, 1].mean()
-            tmp_p = tmp_v * tmp_c
-            tmp = d_rail["railnumber"] + ":" + str(tmp_p)
-            data = data + tmp + ";"
+        for i, d_rail in enumerate(rail_buf):
+            # each rail is averaged over its own new samples, a rail without any repeats its previous power
+            if len(d_rail) > sent[i]:
+                tmp_v = d_rail.voltage(sent[i]).mean()
+                tmp_c = d_rail.current(sent[i]).mean()
+                power[i] = tmp_v * tmp_c
+            data = data + d_rail.name + ":" + str(power[i]) + ";"
         try:
             conn.sendall(bytes(data, encoding="utf8"))
-            last_sec_len_buf = curr_len_buf
+            # only the samples after the last one sent are needed for the next reply
+            for rail in rail_buf:
+                if len(rail):
+                    rail.discard(rail.time.view()[-1])
+            sent = [len(rail) for rail in rail_buf]
         except socket.error as e:
             print("error while sending:: " + str(e))
     print("Closing connection from {:s}:{:d}".format(addr[0], addr[1]))
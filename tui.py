@@ -36,6 +36,8 @@ import sys
 
 import numpy as np
 
+import csv_export
+import data_buffer
 import drv_ftdi
 
 
@@ -43,6 +45,7 @@ MAIN_INFOS = [" Voltage (V) ", " Current (mA) ", " Power (mW) "]
 MAIN_INFOS_PLACE = [1, 41, 81]
 SUB_INFOS = ["now ", "avg ", "min ", "max "]
 SUB_INFOS_PLACE = [1, 11, 21, 31]
+HISTORY = 1  # sec of samples kept by the rails, for the average of the shunt switching
 
 
 def run_ui(board, args):
@@ -50,13 +53,6 @@ def run_ui(board, args):
     rail_data = []
     rail_buf = []
     temp_data = []
-    v_now, c_now, p_now = (0 for i in range(3))
-    v_min = []
-    c_min = []
-    p_min = []
-    v_max = []
-    c_max = []
-    p_max = []
 
     stdscr = curses.initscr()
     num_rows, num_cols = stdscr.getmaxyx()
@@ -64,6 +60,7 @@ def run_ui(board, args):
         curses.endwin()
         print("ERROR : Terminal size is too small for TUI!")
         sys.exit()
+    samples_cursor = board.samples.subscribe()
     thread_process = threading.Thread(target=board.get_data)
     thread_process.start()
     time.sleep(1)
@@ -84,14 +81,23 @@ def run_ui(board, args):
     curses.init_pair(4, curses.COLOR_RED, curses.COLOR_BLACK)
     curses.init_pair(5, curses.COLOR_MAGENTA, curses.COLOR_BLACK)
 
-    for i, rail in enumerate(board.board_mapping_power):
-        rail_buf.append(
-            {
-                "railnumber": rail["name"],
-                "current": np.array([[0, 0]], dtype=np.float16),
-                "voltage": np.array([[0, 0]], dtype=np.float16),
-            }
-        )
+    for rail in board.board_mapping_power:
+        rail_buf.append(data_buffer.RailHistory(rail["name"], indexed=False))
+    rails = {rail["railnumber"]: rail for rail in rail_buf}
+    rows = csv_export.CsvRows(
+        rail_buf[0],
+        [rails[d_rail["name"]] for d_rail in board.rails_to_display],
+        [
+            [group["name"], [rails[name] for name in group["rails"]]]
+            for group in board.power_groups
+        ],
+        temperature=bool(args.dump and board.temperature_sensor),
+    )
+    writer = None
+    if args.dump:
+        file, _, ext = args.dump.partition(".")
+        dump_name = file + "." + (ext or "csv")
+        writer = csv_export.CsvWriter(dump_name, rows.headers())
     # set static informations
     stdscr.border(0)
     stdscr.addstr(0, int(num_cols / 2), "Power Measurements Tool", curses.A_BOLD)
@@ -99,12 +105,6 @@ def run_ui(board, args):
     # get the longest power probe name for correctly display it and init values
     longest_probe_name = 0
     for power_probes in board.rails_to_display:
-        v_min.append(9999)
-        c_min.append(9999)
-        p_min.append(9999)
-        v_max.append(0)
-        c_max.append(0)
-        p_max.append(0)
         longest_probe_name = (
             len(power_probes["name"])
             if len(power_probes["name"]) > longest_probe_name
@@ -176,36 +176,13 @@ def run_ui(board, args):
     # Update collected datas and updated view while q is not pressed
     while True:
         try:
-            remote_buf = []
             drv_ftdi.DATA_LOCK.acquire()
-            for remote_rail in board.data_buf:
-                remote_buf.append(copy.deepcopy(remote_rail))
-                remote_rail["current"] = [[0, 0]]
-                remote_rail["voltage"] = [[0, 0]]
+            new_samples = board.samples.fetch(samples_cursor)
             drv_ftdi.DATA_LOCK.release()
 
-            for rail in remote_buf:
-                local_rail = next(
-                    (
-                        item
-                        for item in rail_buf
-                        if item["railnumber"] == rail["railnumber"]
-                    ),
-                    None,
-                )
-                if len(rail["voltage"]) > 1:
-                    rail["voltage"].pop(0)
-                    rail["current"].pop(0)
-                local_rail["voltage"] = np.append(
-                    local_rail["voltage"],
-                    np.array(rail["voltage"], dtype=np.float16),
-                    axis=0,
-                )
-                local_rail["current"] = np.append(
-                    local_rail["current"],
-                    np.array(rail["current"], dtype=np.float16),
-                    axis=0,
-                )
+            for rail, (t, vbus, vsense, scale) in zip(rail_buf, new_samples):
+                rail.append(t, vbus, vsense, scale, board.samples.scales)
+            temperature = None
             if board.temperature_sensor:
                 drv_ftdi.TEMP_DATA_LOCK.acquire()
                 temp_data = (
@@ -213,30 +190,27 @@ def run_ui(board, args):
                     if len(board.temp_buf) != 0
                     else 0
                 )
+                # readings around the new rows, the temperature is read every second
+                temperature = np.array(board.temp_buf[-2:]).reshape(-1, 2)
                 drv_ftdi.TEMP_DATA_LOCK.release()
+            columns = rows.build(temperature)
+            if columns and writer:
+                writer.write(columns)
+            for rail in rail_buf:
+                if len(rail) and rows.last is not None:
+                    rail.discard(min(rows.last, rail.time.view()[-1] - HISTORY))
             char = stdscr.getch()
             if char == ord("0"):
                 drv_ftdi.FLAG_UI_STOP = True
                 break
             if char == ord("1"):
-                for index, rail in enumerate(board.rails_to_display):
-                    v_min[index] = 9999
-                    c_min[index] = 9999
-                    p_min[index] = 9999
-                    v_max[index] = 0
-                    c_max[index] = 0
-                    p_max[index] = 0
                 drv_ftdi.DATA_LOCK.acquire()
-                for rail in board.data_buf:
-                    rail["current"] = [[0, 0]]
-                    rail["voltage"] = [[0, 0]]
+                board.samples.skip(samples_cursor)
+                board.energy.clear()
                 drv_ftdi.DATA_LOCK.release()
                 for rail in rail_buf:
-                    rail["current"] = [[0, 0]]
-                    rail["voltage"] = [[0, 0]]
-                v_avg = 0
-                c_avg = 0
-                p_avg = 0
+                    rail.reset()
+                rows.reset()
                 drv_ftdi.T_START = time.time()
                 time_start = time.time()
             if char == ord("2"):
@@ -273,74 +247,18 @@ def run_ui(board, args):
                     ),
                     None,
                 )
-                if rail and len(rail["voltage"]) > 2:
-                    v_now = rail["voltage"][-1, 1]
-                    rail_data.append(v_now)
-                    v_avg = rail["voltage"][1:, 1].mean(0)
-                    rail_data.append(v_avg)
-                    v_min[index] = v_now if v_now < v_min[index] else v_min[index]
-                    rail_data.append(v_min[index])
-                    v_max[index] = v_now if v_now > v_max[index] else v_max[index]
-                    rail_data.append(v_max[index])
-
-                    c_now = rail["current"][-1, 1]
-                    rail_data.append(c_now)
-                    c_avg = rail["current"][1:, 1].mean(0)
-                    rail_data.append(c_avg)
-                    c_min[index] = c_now if c_now < c_min[index] else c_min[index]
-                    rail_data.append(c_min[index])
-                    c_max[index] = c_now if c_now > c_max[index] else c_max[index]
-                    rail_data.append(c_max[index])
-
-                    p_now = v_now * c_now
-                    rail_data.append(p_now)
-                    p_avg = v_avg * c_avg
-                    rail_data.append(p_avg)
-                    p_min[index] = p_now if p_now < p_min[index] else p_min[index]
-                    rail_data.append(p_min[index])
-                    p_max[index] = p_now if p_now > p_max[index] else p_max[index]
-                    rail_data.append(p_max[index])
-
-                    for ind, group in enumerate(board.power_groups):
-                        power_group = np.zeros([1, 2], dtype=np.float16)
-                        for rail_group in group["rails"]:
-                            rail = next(
-                                (
-                                    item
-                                    for item in rail_buf
-                                    if item["railnumber"] == rail_group
-                                ),
-                                None,
-                            )
-                            power_rail = np.empty_like(rail["voltage"][1:])
-                            power_rail[:, 0] = rail["voltage"][1:, 0]
-                            power_rail[:, 1] = (
-                                rail["voltage"][1:, 1] * rail["current"][1:, 1]
-                            )
-                            if power_group.shape[0] > power_rail.shape[0]:
-                                power_group.resize(power_rail.shape)
-                            elif power_rail.shape[0] - power_group.shape[0] <= 2:
-                                power_rail.resize(power_group.shape)
-                            power_group = power_group + power_rail
-                        power_group[:, 0] = power_rail[:, 0]
-                        avg_power_group = power_group[:, 1].mean()
-                        min_power_group = power_group[:, 1].min()
-                        max_power_group = power_group[:, 1].max()
-                        stdscr.addstr(
-                            6 + group_ind + ind,
-                            20,
-                            "avg power: " + str("%.2f" % avg_power_group),
-                        )
-                        stdscr.addstr(
-                            6 + group_ind + ind,
-                            40,
-                            "min power: " + str("%.2f" % min_power_group),
-                        )
-                        stdscr.addstr(
-                            6 + group_ind + ind,
-                            60,
-                            "max power: " + str("%.2f" % max_power_group),
-                        )
+                if rail and len(rail):
+                    v_now = rail.voltage(-1)[0]
+                    c_now = rail.current(-1)[0]
+                    for now, stats in (
+                        (v_now, rail.stats["voltage"]),
+                        (c_now, rail.stats["current"]),
+                        (v_now * c_now, rail.stats["power"]),
+                    ):
+                        rail_data.append(now)
+                        rail_data.append(stats.mean())
+                        rail_data.append(stats.minimum)
+                        rail_data.append(stats.maximum)
 
                     ind_s = 0
                     for ind_m in range(len(MAIN_INFOS)):
@@ -385,7 +303,8 @@ def run_ui(board, args):
                         + " sec"
                         + " ; Frequency : "
                         + str(
-                            "%.1f" % (rail["voltage"].shape[0] / rail["voltage"][-1, 0])
+                            "%.1f"
+                            % (rail.stats["voltage"].count / rail.time.view()[-1])
                         )
                         + "Hz",
                     )
@@ -407,6 +326,24 @@ def run_ui(board, args):
                     stdscr.clrtoeol()
                     rail_data.clear()
                     stdscr.refresh()
+            for ind, group in enumerate(board.power_groups):
+                stats = rows.group_stats[group["name"]]
+                if stats.count:
+                    stdscr.addstr(
+                        6 + group_ind + ind,
+                        20,
+                        "avg power: " + str("%.2f" % stats.mean()),
+                    )
+                    stdscr.addstr(
+                        6 + group_ind + ind,
+                        40,
+                        "min power: " + str("%.2f" % stats.minimum),
+                    )
+                    stdscr.addstr(
+                        6 + group_ind + ind,
+                        60,
+                        "max power: " + str("%.2f" % stats.maximum),
+                    )
             if args.time:
                 if curr_time >= int(args.time):
                     drv_ftdi.FLAG_UI_STOP = True
@@ -420,62 +357,21 @@ def run_ui(board, args):
     stdscr.keypad(0)
     curses.echo()
     curses.endwin()
-    if args.dump:
-        file, _, ext = args.dump.partition(".")
-        if ext:
-            name = file + "." + ext
-        else:
-            name = file + ".csv"
-        headers = []
-        data = []
-        type_data = ["voltage", "current", "power"]
-        type_data_unit = [" (V)", " (mA)", " (mW)"]
-        array_size = rail_buf[-1]["voltage"].shape[0]
-        data.append(rail_buf[0]["voltage"][1:array_size, 0])
-        headers.append("Time (ms)")
-        for d_rail in board.rails_to_display:
-            rail = next(
-                (item for item in rail_buf if item["railnumber"] == d_rail["name"]),
-                None,
+    if board.energy:
+        print("Energy measured by the PAC accumulators:")
+        drv_ftdi.DATA_LOCK.acquire()
+        for name, (energy, duration) in board.energy.items():
+            print(
+                name
+                + ": "
+                + str("%.3f" % energy)
+                + " mJ in "
+                + str("%.2f" % duration)
+                + " sec, average power: "
+                + str("%.3f" % (energy / duration if duration else 0))
+                + " mW"
             )
-            for j in range(3):
-                headers.append(
-                    str(d_rail["name"] + " " + type_data[j] + type_data_unit[j])
-                )
-                if j != 2:
-                    data.append(rail[type_data[j]][1:array_size, 1])
-                else:
-                    data.append(
-                        rail["current"][1:array_size, 1]
-                        * rail["voltage"][1:array_size, 1]
-                    )
-        if board.power_groups:
-            power_group = np.zeros([1, 2], dtype=np.float16)
-            for group in board.power_groups:
-                headers.append(group["name"] + " power (mW)")
-                for rail_group in group["rails"]:
-                    rail = next(
-                        (item for item in rail_buf if item["railnumber"] == rail_group),
-                        None,
-                    )
-                    power_rail = np.empty_like(rail["voltage"][1:array_size])
-                    power_rail[:, 0] = rail["voltage"][1:array_size, 0]
-                    power_rail[:, 1] = (
-                        rail["voltage"][1:array_size, 1]
-                        * rail["current"][1:array_size, 1]
-                    )
-                    if power_group.shape[0] > power_rail.shape[0]:
-                        power_group.resize(power_rail.shape, refcheck=False)
-                    elif power_rail.shape[0] - power_group.shape[0] <= 2:
-                        power_rail.resize(power_group.shape)
-                    power_group = power_group + power_rail
-                data.append(power_group[:, 1])
-        np.savetxt(
-            name,
-            np.column_stack(data),
-            delimiter=",",
-            header=",".join(headers),
-            fmt="%1.4f",
-            comments="",
-        )
-        print("Saved data in file " + name)
+        drv_ftdi.DATA_LOCK.release()
+    if writer:
+        writer.close()
+        print("Saved data in file " + dump_name)